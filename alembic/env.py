@@ -1,3 +1,4 @@
+import os
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -5,6 +6,8 @@ from sqlalchemy import pool
 
 from alembic import context
 
+from db.db_engine import DATABASE_URL, Base
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -14,11 +17,12 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
-# add your model's MetaData object here
-# for 'autogenerate' support
-# from myapp import mymodel
-# target_metadata = mymodel.Base.metadata
-target_metadata = None
+# The bot's connection settings take precedence over sqlalchemy.url of alembic.ini,
+# so the migrations run against the same database as the application
+if os.getenv('DATABASE_URL') or os.getenv('POSTGRES_HOST'):
+    config.set_main_option('sqlalchemy.url', DATABASE_URL.replace('%', '%%'))
+
+target_metadata = Base.metadata
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
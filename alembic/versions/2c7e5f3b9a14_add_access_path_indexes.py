@@ -0,0 +1,31 @@
+"""add access path indexes
+
+Revision ID: 2c7e5f3b9a14
+Revises: 8f4c1a6d2e90
+Create Date: 2026-10-18 11:24:05.113290
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c7e5f3b9a14'
+down_revision: Union[str, None] = '8f4c1a6d2e90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_bug_reports_user_id'), 'bug_reports', ['user_id'], unique=False)
+    op.create_index(op.f('ix_bug_reports_report_status'), 'bug_reports', ['report_status'], unique=False)
+    op.create_index('ix_results_student_class_age_category', 'results', ['student_class', 'age_category'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_results_student_class_age_category', table_name='results')
+    op.drop_index(op.f('ix_bug_reports_report_status'), table_name='bug_reports')
+    op.drop_index(op.f('ix_bug_reports_user_id'), table_name='bug_reports')
@@ -19,8 +19,21 @@ depends_on: Union[str, Sequence[str], None] = None
 
 
 def upgrade() -> None:
-    pass
+    op.create_table(
+        'results',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(), nullable=True),
+        sa.Column('first_name', sa.String(), nullable=True),
+        sa.Column('last_name', sa.String(), nullable=True),
+        sa.Column('student_class', sa.String(), nullable=True),
+        sa.Column('age_category', sa.String(), nullable=True),
+        sa.Column('family_factor', sa.Integer(), nullable=False),
+        sa.Column('psychological_factor', sa.Integer(), nullable=False),
+        sa.Column('env_factor', sa.Integer(), nullable=False),
+        sa.Column('school_factor', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id')
+    )
 
 
 def downgrade() -> None:
-    pass
+    op.drop_table('results')
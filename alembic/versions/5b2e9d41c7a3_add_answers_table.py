@@ -0,0 +1,39 @@
+"""add answers table
+
+Revision ID: 5b2e9d41c7a3
+Revises: d63be4a8086d
+Create Date: 2026-10-18 10:45:12.517204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2e9d41c7a3'
+down_revision: Union[str, None] = 'd63be4a8086d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'answers',
+        sa.Column('answer_id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('bank', sa.String(), nullable=False),
+        sa.Column('question_number', sa.SmallInteger(), nullable=False),
+        sa.Column('answer_index', sa.SmallInteger(), nullable=False),
+        sa.Column('points', sa.SmallInteger(), nullable=False),
+        sa.Column('answered_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['results.user_id'], ),
+        sa.PrimaryKeyConstraint('answer_id')
+    )
+    op.create_index(op.f('ix_answers_user_id'), 'answers', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_answers_user_id'), table_name='answers')
+    op.drop_table('answers')
@@ -0,0 +1,50 @@
+"""add result stats table
+
+Revision ID: 8f4c1a6d2e90
+Revises: 5b2e9d41c7a3
+Create Date: 2026-10-18 11:02:37.860142
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f4c1a6d2e90'
+down_revision: Union[str, None] = '5b2e9d41c7a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+RESULT_BAND_FIELDS = (
+    'family_factor_result',
+    'psychological_factor_result',
+    'env_factor_result',
+    'school_factor_result',
+    'total_risk_result',
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        'result_stats',
+        sa.Column('student_class', sa.String(), nullable=False),
+        sa.Column('age_category', sa.String(), nullable=False),
+        sa.Column('field', sa.String(), nullable=False),
+        sa.Column('band', sa.String(), nullable=False),
+        sa.Column('respondents', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('student_class', 'age_category', 'field', 'band')
+    )
+    # Counting the surveys finished before the table existed
+    for field in RESULT_BAND_FIELDS:
+        op.execute(
+            f"INSERT INTO result_stats (student_class, age_category, field, band, respondents) "
+            f"SELECT COALESCE(student_class, ''), COALESCE(age_category, ''), '{field}', {field}, COUNT(*) "
+            f"FROM results WHERE total_risk_result IS NOT NULL "
+            f"GROUP BY COALESCE(student_class, ''), COALESCE(age_category, ''), {field}"
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('result_stats')
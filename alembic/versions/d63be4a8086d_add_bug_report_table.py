@@ -19,8 +19,16 @@ depends_on: Union[str, Sequence[str], None] = None
 
 
 def upgrade() -> None:
-    pass
+    op.create_table(
+        'bug_reports',
+        sa.Column('report_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('report_status', sa.String(), nullable=False),
+        sa.Column('description', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['results.user_id'], ),
+        sa.PrimaryKeyConstraint('report_id')
+    )
 
 
 def downgrade() -> None:
-    pass
+    op.drop_table('bug_reports')
@@ -19,8 +19,18 @@ depends_on: Union[str, Sequence[str], None] = None
 
 
 def upgrade() -> None:
-    pass
+    op.add_column('results', sa.Column('total_risk', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('results', sa.Column('family_factor_result', sa.String(), nullable=True))
+    op.add_column('results', sa.Column('psychological_factor_result', sa.String(), nullable=True))
+    op.add_column('results', sa.Column('env_factor_result', sa.String(), nullable=True))
+    op.add_column('results', sa.Column('school_factor_result', sa.String(), nullable=True))
+    op.add_column('results', sa.Column('total_risk_result', sa.String(), nullable=True))
 
 
 def downgrade() -> None:
-    pass
+    op.drop_column('results', 'total_risk_result')
+    op.drop_column('results', 'school_factor_result')
+    op.drop_column('results', 'env_factor_result')
+    op.drop_column('results', 'psychological_factor_result')
+    op.drop_column('results', 'family_factor_result')
+    op.drop_column('results', 'total_risk')
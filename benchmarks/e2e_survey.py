@@ -0,0 +1,284 @@
+"""End-to-end load test of the webhook app
+
+Starts ``main.app`` with uvicorn next to a local fake Bot API server and
+replays synthetic respondents through the whole survey: /start, name,
+last name, class, confirmation, age category and every answer. Each
+respondent sends its updates one after another, ``--concurrency``
+respondents are in flight at once.
+
+Reported are processed updates per second, p50/p99 latency of the webhook
+requests, SQL statements and Bot API calls per finished survey. With
+WEBHOOK_FAST_ACK=1 the latency is the time to the acknowledgement, updates
+rejected with 503 are sent again like Telegram does.
+
+Pacing of outgoing messages and the anti-flood limits are switched off, the
+harness measures the bot and not the Telegram limits. The database is a
+fresh SQLite file unless ``--database-url`` is given, don't point it to the
+production database. The schema is created by ``alembic upgrade head``.
+
+Usage:
+    python -m benchmarks.e2e_survey [--respondents 1000] [--concurrency 50] [--database-url URL]
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import List, Set
+
+from aiohttp import ClientSession, web
+
+AGE_CATEGORIES = ('14-15 лет', '16-18 лет')
+FINISH_TEXT = 'Спасибо, опрос завершен'
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--respondents', type=int, default=1000, help='number of surveys')
+    parser.add_argument('--concurrency', type=int, default=50, help='respondents in flight at once')
+    parser.add_argument('--database-url', help='SQLAlchemy URL of the benchmark database')
+    parser.add_argument('--first-user-id', type=int, default=None,
+                        help='Telegram id of the first respondent, random by default')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the chosen answers')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds to wait for queued updates')
+    return parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def configure_environment(args: argparse.Namespace, api_url: str):
+    """Environment of the benchmarked app, it is read when ``main`` is imported
+
+    :param args: command line arguments
+    :param api_url: fake Bot API url
+    :return:
+    """
+    database_url = args.database_url
+    if not database_url:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='ggl_bot_bench_'), 'bench.sqlite3')
+
+    os.environ.update({
+        'DATABASE_URL': database_url,
+        'BOT_API_URL': api_url,
+        'BOT_TOKEN': '123456789:benchmark',
+        'HOST_URL': 'https://bench.invalid',
+        'MONITORING_TOKEN': 'benchmark',
+        'OUTBOUND_GLOBAL_RATE': '1000000',
+        'OUTBOUND_CHAT_RATE': '1000000',
+        'OUTBOUND_CHAT_BURST': '1000000',
+        'THROTTLE_RATE': '1000000',
+        'THROTTLE_BURST': '1000000',
+        'THROTTLE_ANSWER_RATE': '1000000',
+        'THROTTLE_ANSWER_BURST': '1000000',
+    })
+    # Update log lines would dominate the console and the measured time
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+
+def migrate_database():
+    """Creating the schema of the benchmark database the same way as in production
+
+    :return:
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-m', 'alembic', 'upgrade', 'head'], cwd=root, check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+class FakeBotAPI:
+    """Local stand-in for the Telegram Bot API, every call succeeds"""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.finished: Set[int] = set()
+        self._message_ids = itertools.count(1)
+
+    def _message(self, chat_id: int, text: str = '') -> dict:
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': text,
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method'].lower()
+        data = await request.post()
+        self.calls[method] += 1
+
+        chat_id = int(data.get('chat_id', 0) or 0)
+        if method.startswith('send') or method == 'editmessagetext':
+            text = data.get('text', '')
+            if text.startswith(FINISH_TEXT):
+                self.finished.add(chat_id)
+            result = self._message(chat_id, text)
+        elif method == 'copymessage':
+            result = {'message_id': next(self._message_ids)}
+        elif method == 'getwebhookinfo':
+            result = {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self, port: int) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        return runner
+
+
+class Respondent:
+    """Synthetic user going through the survey"""
+
+    update_ids = itertools.count(1)
+
+    def __init__(self, user_id: int, rng: random.Random):
+        self.user_id = user_id
+        self.rng = rng
+        self.age_category = rng.choice(AGE_CATEGORIES)
+        self.user = {'id': user_id, 'is_bot': False, 'first_name': 'Bench', 'username': f'bench{user_id}'}
+        self.chat = {'id': user_id, 'type': 'private', 'first_name': 'Bench'}
+
+    def message(self, text: str) -> dict:
+        update_id = next(self.update_ids)
+        message = {'message_id': update_id, 'date': int(time.time()), 'chat': self.chat, 'from': self.user,
+                   'text': text}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        return {'update_id': update_id, 'message': message}
+
+    def callback_query(self, data: str) -> dict:
+        update_id = next(self.update_ids)
+        return {
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': self.user,
+                'chat_instance': str(self.user_id),
+                'data': data,
+                'message': {'message_id': update_id, 'date': int(time.time()), 'chat': self.chat, 'text': ''},
+            },
+        }
+
+    def updates(self):
+        """Updates of the whole survey, in order
+
+        :return: Telegram updates
+        """
+        from bot_app.keyboard.answer_codec import encode_answer
+        from bot_app.question_bank import get_question_bank
+
+        for text in ('/start', 'Иван', 'Иванов', f'{self.rng.randint(8, 11)}А', 'Да', self.age_category):
+            yield self.message(text)
+
+        question_bank = get_question_bank('low' if self.age_category == AGE_CATEGORIES[0] else 'high')
+        for number in range(1, len(question_bank) + 1):
+            question = question_bank.get(number)
+            yield self.callback_query(encode_answer(number, self.rng.randrange(len(question.answers))))
+
+
+async def run_respondent(client: ClientSession, webhook_url: str, respondent: Respondent,
+                         latencies: List[float], rejected: Counter):
+    for update in respondent.updates():
+        while True:
+            started = time.perf_counter()
+            async with client.post(webhook_url, json=update) as response:
+                await response.read()
+            latencies.append(time.perf_counter() - started)
+            if response.status != 503:
+                response.raise_for_status()
+                break
+            # Lane is full, Telegram would deliver the update again later
+            rejected['updates'] += 1
+            await asyncio.sleep(0.05)
+
+
+def percentile(values: List[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+async def run(args: argparse.Namespace) -> bool:
+    fake_api = FakeBotAPI()
+    api_port = free_port()
+    api_runner = await fake_api.start(api_port)
+    configure_environment(args, f'http://127.0.0.1:{api_port}')
+    migrate_database()
+
+    import uvicorn
+    from prometheus_client import REGISTRY
+
+    import main
+
+    app_port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host='127.0.0.1', port=app_port, log_level='warning'))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if server_task.done():
+            server_task.result()
+            return False
+        await asyncio.sleep(0.05)
+
+    rng = random.Random(args.seed)
+    first_user_id = args.first_user_id or random.randrange(10 ** 8, 10 ** 9)
+    respondents = [Respondent(first_user_id + number, random.Random(rng.random())) for number in range(args.respondents)]
+    webhook_url = f'http://127.0.0.1:{app_port}{main.WEBHOOK_PATH}'
+
+    latencies: List[float] = []
+    rejected = Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(client: ClientSession, respondent: Respondent):
+        async with semaphore:
+            await run_respondent(client, webhook_url, respondent, latencies, rejected)
+
+    db_queries_before = REGISTRY.get_sample_value('db_queries_total') or 0
+    api_calls_before = sum(fake_api.calls.values())
+    started = time.perf_counter()
+    async with ClientSession() as client:
+        await asyncio.gather(*(limited(client, respondent) for respondent in respondents))
+
+    # With WEBHOOK_FAST_ACK=1 the updates may still be in the lanes
+    user_ids = {respondent.user_id for respondent in respondents}
+    deadline = time.monotonic() + args.timeout
+    while not user_ids <= fake_api.finished and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    finished = len(user_ids & fake_api.finished)
+    db_queries = (REGISTRY.get_sample_value('db_queries_total') or 0) - db_queries_before
+    api_calls = sum(fake_api.calls.values()) - api_calls_before
+    updates = len(latencies) - rejected['updates']
+
+    print(f'database: {os.environ["DATABASE_URL"]}, fast ack: {main.WEBHOOK_FAST_ACK}')
+    print(f'respondents: {args.respondents}, concurrency: {args.concurrency}, finished surveys: {finished}')
+    print(f'updates: {updates} in {elapsed:.2f} s, {updates / elapsed:.1f} updates/s, rejected: {rejected["updates"]}')
+    print(f'webhook latency: p50 {statistics.median(latencies) * 1000:.2f} ms, '
+          f'p99 {percentile(latencies, 0.99) * 1000:.2f} ms')
+    if finished:
+        print(f'per survey: {db_queries / finished:.1f} SQL statements, {api_calls / finished:.1f} Bot API calls')
+    print('Bot API calls: ' + ', '.join(f'{method} {count}' for method, count in fake_api.calls.most_common()))
+
+    server.should_exit = True
+    await server_task
+    await api_runner.cleanup()
+    return finished == args.respondents
+
+
+if __name__ == '__main__':
+    if not asyncio.run(run(parse_args())):
+        print('not every survey was finished')
+        sys.exit(1)
@@ -0,0 +1,134 @@
+"""Import and startup time of the entry points
+
+Imports ``main`` and ``bot_main`` in fresh interpreters and fails if the
+median import time is over the budget or if the import created the database
+engine or loaded the database driver. Then starts the webhook app with
+uvicorn next to the fake Bot API of ``benchmarks.e2e_survey`` and measures
+the time from the process start until the app serves requests.
+
+Budgets depend on the machine, the defaults leave about half again as much
+time as the imports take on a developer laptop.
+
+Usage:
+    python -m benchmarks.startup_time [--runs 5] [--main-budget 1.5] [--bot-main-budget 1.0]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+from aiohttp import ClientError, ClientSession
+
+from benchmarks.e2e_survey import FakeBotAPI, configure_environment, free_port, migrate_database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = '''
+import sys
+import time
+
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+
+import db.db_engine
+print(elapsed, db.db_engine._engine is not None, 'psycopg2' in sys.modules)
+'''
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='measurements of every entry point')
+    parser.add_argument('--main-budget', type=float, default=1.5, help='seconds to import main')
+    parser.add_argument('--bot-main-budget', type=float, default=1.0, help='seconds to import bot_main')
+    parser.add_argument('--startup-budget', type=float, default=3, help='seconds until the webhook app serves')
+    parser.add_argument('--database-url', help='SQLAlchemy URL of the benchmark database')
+    return parser.parse_args()
+
+
+def measure_import(module: str) -> Tuple[float, bool, bool]:
+    """Importing the module in a fresh interpreter
+
+    :param module: module name
+    :return: (import seconds, engine created, database driver loaded)
+    """
+    output = subprocess.run([sys.executable, '-c', IMPORT_PROBE.format(module=module)], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    elapsed, engine_created, driver_loaded = output.split()
+    return float(elapsed), engine_created == 'True', driver_loaded == 'True'
+
+
+def check_import(module: str, runs: int, budget: float) -> bool:
+    times: List[float] = []
+    side_effects = False
+    for _ in range(runs):
+        elapsed, engine_created, driver_loaded = measure_import(module)
+        times.append(elapsed)
+        side_effects = side_effects or engine_created or driver_loaded
+
+    median = statistics.median(times)
+    print(f'import {module}: median {median * 1000:.0f} ms, max {max(times) * 1000:.0f} ms, '
+          f'budget {budget * 1000:.0f} ms')
+    if side_effects:
+        print(f'importing {module} created the database engine or loaded the driver')
+    return median <= budget and not side_effects
+
+
+async def measure_startup(port: int) -> float:
+    """Starting the webhook app in a new process
+
+    :param port: app port
+    :return: seconds from the process start until the app serves requests
+    """
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+        '--log-level', 'warning', cwd=ROOT
+    )
+    try:
+        async with ClientSession() as client:
+            while True:
+                if process.returncode is not None:
+                    raise RuntimeError(f'app exited with code {process.returncode}')
+                try:
+                    # Touches the connection pool, so the database engine is ready too
+                    headers = {'Authorization': f"Bearer {os.environ['MONITORING_TOKEN']}"}
+                    async with client.get(f'http://127.0.0.1:{port}/info/db', headers=headers) as response:
+                        if response.status == 200:
+                            return time.perf_counter() - started
+                except ClientError:
+                    pass
+                await asyncio.sleep(0.01)
+    finally:
+        process.terminate()
+        await process.wait()
+
+
+async def run(args: argparse.Namespace) -> bool:
+    fake_api = FakeBotAPI()
+    api_port = free_port()
+    api_runner = await fake_api.start(api_port)
+    configure_environment(args, f'http://127.0.0.1:{api_port}')
+    migrate_database()
+
+    passed = True
+    for module, budget in (('main', args.main_budget), ('bot_main', args.bot_main_budget)):
+        passed = check_import(module, args.runs, budget) and passed
+
+    times = [await measure_startup(free_port()) for _ in range(args.runs)]
+    median = statistics.median(times)
+    print(f'webhook app startup: median {median * 1000:.0f} ms, max {max(times) * 1000:.0f} ms, '
+          f'budget {args.startup_budget * 1000:.0f} ms')
+
+    await api_runner.cleanup()
+    return passed and median <= args.startup_budget
+
+
+if __name__ == '__main__':
+    if not asyncio.run(run(parse_args())):
+        print('startup is over the budget')
+        sys.exit(1)
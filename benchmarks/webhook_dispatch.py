@@ -0,0 +1,76 @@
+"""Per-update latency of the webhook endpoint
+
+Sends updates which match no handler through ``main.bot_webhook`` and
+compares the latency of the first and the last batch. Handlers are
+registered once, so the latency has to stay flat however many updates
+were processed. The app is started and stopped by its lifespan, Bot API
+calls go to the fake server of ``benchmarks.e2e_survey``.
+
+Usage:
+    python -m benchmarks.webhook_dispatch [updates] [batch]
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from benchmarks.e2e_survey import FakeBotAPI, configure_environment, free_port
+
+MAX_SLOWDOWN = 1.5
+
+
+def make_update(update_id: int) -> dict:
+    """Text message from a user without state, no handler matches it
+
+    :param update_id: update id
+    :return: Telegram update
+    """
+    chat = {'id': update_id % 1000 + 1, 'type': 'private', 'first_name': 'bench'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': chat,
+            'from': {'id': chat['id'], 'is_bot': False, 'first_name': 'bench'},
+            'text': 'hello',
+        },
+    }
+
+
+async def run(updates: int, batch: int):
+    fake_api = FakeBotAPI()
+    api_port = free_port()
+    api_runner = await fake_api.start(api_port)
+    # No handler matches the updates, so the database is never queried
+    configure_environment(argparse.Namespace(database_url=None), f'http://127.0.0.1:{api_port}')
+
+    import main
+
+    latencies = []
+    async with main.lifespan(main.app):
+        handlers_count = len(main.dp.message_handlers.handlers)
+        for update_id in range(1, updates + 1):
+            update = make_update(update_id)
+            started = time.perf_counter()
+            await main.bot_webhook(update)
+            latencies.append(time.perf_counter() - started)
+
+        assert len(main.dp.message_handlers.handlers) == handlers_count, 'handlers were registered again'
+    await api_runner.cleanup()
+
+    first = statistics.median(latencies[:batch]) * 1e6
+    last = statistics.median(latencies[-batch:]) * 1e6
+    print(f'updates: {updates}, handlers: {handlers_count}')
+    print(f'first {batch}: median {first:.1f} us')
+    print(f'last {batch}: median {last:.1f} us')
+    return last <= first * MAX_SLOWDOWN
+
+
+if __name__ == '__main__':
+    updates_number = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+    if not asyncio.run(run(updates_number, batch_size)):
+        print('per-update latency grows with the number of processed updates')
+        sys.exit(1)
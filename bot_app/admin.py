@@ -0,0 +1,132 @@
+import html
+import os
+import tempfile
+from itertools import groupby
+from typing import Iterator, List
+
+from aiogram import types, Dispatcher
+
+from bot_app.scoring import BANDS
+from db.async_db import run_sync
+from db.db_engine import RESULT_BAND_FIELDS, get_result_stats
+from db.export import EXPORT_FORMATS, export_results, normalize_age_category
+
+EXPORT_USAGE = ('Использование: /export [csv|xlsx] [class=<класс>] [age=low|high]\n'
+                'Например: /export xlsx class=9А age=low')
+STATS_USAGE = ('Использование: /stats [class=<класс>] [age=low|high]\n'
+               'Например: /stats class=9А')
+
+FIELD_NAMES = {
+    'total_risk_result': 'Общий риск',
+    'family_factor_result': 'Семья',
+    'psychological_factor_result': 'Психологические факторы',
+    'env_factor_result': 'Окружение',
+    'school_factor_result': 'Школа',
+}
+MESSAGE_LIMIT = 4000
+
+
+def parse_export_args(args: str, export_format: bool = True) -> dict:
+    """Parsing the arguments of the export and stats commands
+
+    :param args: command arguments, e.g. 'xlsx class=9А age=low'
+    :param export_format: whether a file format may be given
+    :return: student_class, age_category and export_format if it may be given
+    :raises ValueError: invalid arguments
+    """
+    options = {'student_class': None, 'age_category': None}
+    if export_format:
+        options['export_format'] = 'csv'
+    for arg in args.split():
+        key, _, value = arg.partition('=')
+        if export_format and not value and key.lower() in EXPORT_FORMATS:
+            options['export_format'] = key.lower()
+        elif key == 'class' and value:
+            options['student_class'] = value
+        elif key == 'age' and value:
+            options['age_category'] = normalize_age_category(value)
+        else:
+            raise ValueError(f'Неизвестный параметр: {arg}')
+    return options
+
+
+async def export_command(message: types.Message):
+    """Sending the survey results file to the admin
+
+    The file is written in the database thread pool, so a large export does
+    not block the processing of other updates.
+
+    :param message: message object
+    :return:
+    """
+    try:
+        options = parse_export_args(message.get_args() or '')
+    except ValueError as ex:
+        await message.answer(f'{ex}\n\n{EXPORT_USAGE}')
+        return
+
+    export_format = options.pop('export_format')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f'results.{export_format}')
+        with open(path, 'wb') as file:
+            await run_sync(export_results, file, export_format, **options)
+        await message.answer_document(types.InputFile(path))
+
+
+def format_stats(rows: List[tuple]) -> Iterator[str]:
+    """Formatting result band counters, one block per class and age category
+
+    :param rows: (student_class, age_category, field, band, respondents) rows ordered by class and age category
+    :return: text blocks
+    """
+    for (student_class, age_category), group in groupby(rows, key=lambda row: row[:2]):
+        counts = {(field, band): respondents for _, _, field, band, respondents in group}
+        total = sum(counts.get(('total_risk_result', band), 0) for band in BANDS)
+
+        lines = [f'<b>{html.escape(student_class) or "Класс не указан"}, {age_category or "возраст не указан"}</b>: {total}']
+        for field in (RESULT_BAND_FIELDS[-1],) + RESULT_BAND_FIELDS[:-1]:
+            bands = ', '.join(f'{band.lower()} {counts.get((field, band), 0)}' for band in BANDS)
+            lines.append(f'{FIELD_NAMES[field]}: {bands}')
+        yield '\n'.join(lines)
+
+
+async def stats_command(message: types.Message):
+    """Sending the number of respondents per result band of every class
+
+    The answer is read from the result_stats counters, which are updated
+    when a survey is finished, so it does not scan the results table.
+
+    :param message: message object
+    :return:
+    """
+    try:
+        options = parse_export_args(message.get_args() or '', export_format=False)
+    except ValueError as ex:
+        await message.answer(f'{ex}\n\n{STATS_USAGE}')
+        return
+
+    rows = await run_sync(get_result_stats, **options)
+    if not rows:
+        await message.answer('Нет завершенных опросов')
+        return
+
+    text = ''
+    for block in format_stats(rows):
+        if text and len(text) + len(block) + 2 > MESSAGE_LIMIT:
+            await message.answer(text, parse_mode=types.ParseMode.HTML)
+            text = ''
+        text = f'{text}\n\n{block}' if text else block
+    await message.answer(text, parse_mode=types.ParseMode.HTML)
+
+
+def admin_register_handlers(dp: Dispatcher):
+    """Admin Handlers
+
+    :param dp: Dispatcher object
+    :return:
+    """
+    admin_id = os.getenv('ADMIN_ID')
+    if not admin_id:
+        return
+    dp.register_message_handler(export_command, commands='export', user_id=int(admin_id), state='*')
+    dp.register_message_handler(stats_command, commands='stats', user_id=int(admin_id), state='*')
@@ -8,7 +8,8 @@ from dotenv import load_dotenv
 from bot_app.keyboard.keyboard_generator import create_bug_report_keyboard, create_reply_keyboard, \
     BUG_REPORT_CALLBACK_DATA
 from bot_main import ReportAnswer, bot, Report
-from db.db_engine import Session, Results, User
+from db.async_db import AsyncUser
+from dispatching.rate_limiter import background_priority
 
 
 async def cancel(message: types.Message, state: FSMContext):
@@ -35,16 +36,13 @@ async def start_report_mess(message: types.Message):
     """
     cancel_button = create_reply_keyboard()
 
-    session = Session()
-    with session:
-        user_exists = session.query(Results).filter_by(user_id=message.from_user.id).first()
-        if user_exists is None:
-            user = User(
-                user_id=message.from_user.id
-            )
-            user.add_user(
-                username=message.from_user.username
-            )
+    user = AsyncUser(
+        user_id=message.from_user.id
+    )
+    if not await user.exists():
+        await user.add_user(
+            username=message.from_user.username
+        )
 
     await bot.send_message(
         message.from_user.id, f'Опишите проблему, с которой вы столкнулись',
@@ -64,16 +62,17 @@ async def send_report(message: types.Message, state: FSMContext):
     send_report_answer = create_bug_report_keyboard(message.from_user.id)
     load_dotenv()
 
-    await bot.copy_message(
-        os.getenv('ADMIN_ID'),
-        message.from_user.id, message.message_id,
-        reply_markup=send_report_answer
-    )
+    with background_priority():
+        await bot.copy_message(
+            os.getenv('ADMIN_ID'),
+            message.from_user.id, message.message_id,
+            reply_markup=send_report_answer
+        )
 
-    user = User(
+    user = AsyncUser(
         user_id=message.from_user.id
     )
-    user.add_bug_report(
+    await user.add_bug_report(
         description=message.text
     )
 
@@ -120,10 +119,10 @@ async def send_answer(message: types.Message, state: FSMContext):
     user_id = data['id']
     message_id = data['message_id']
 
-    user = User(
+    user = AsyncUser(
         user_id=message.from_user.id
     )
-    user.edit_bug_report_status(
+    await user.edit_bug_report_status(
         status='Closed'
     )
 
@@ -1,108 +1,148 @@
-import json
-from typing import NamedTuple
+import logging
+import os
+from typing import Iterable, List, Optional, Tuple
 
 from aiogram import types, Dispatcher
 from aiogram.dispatcher import FSMContext
 from aiogram.types import ReplyKeyboardRemove
+from aiogram.utils.exceptions import TelegramAPIError
 
-from bot_app.keyboard.keyboard_generator import create_answer_keyboard, ANSWER_CALLBACK_DATA
+from bot_app.keyboard.answer_codec import AnswerPayload, answer_filter
+from bot_app.keyboard.keyboard_generator import get_answer_keyboard
+from bot_app.question_bank import Question, get_question_bank
+from bot_app.scoring import AGE_CATEGORY_LOW, AGE_CATEGORY_HIGH, FACTORS, get_question_factor, score_answers
 from bot_main import RegistrationStates, bot
-from db.db_engine import Session, Results, User
+from db.answer_log import answer_log
+from db.async_db import AsyncUser
 
-AGE_CATEGORY_LOW = '14-15 лет'
-AGE_CATEGORY_HIGH = '16-18 лет'
+logger = logging.getLogger('aiogram')
 
+SURVEY_SAVE_MODE = os.getenv('SURVEY_SAVE_MODE', 'final')
+SURVEY_MESSAGE_MODE = os.getenv('SURVEY_MESSAGE_MODE', 'edit')
 
-class Question(NamedTuple):
-    """Question representation"""
-    number: int
-    text: str
-    answers: list
+SAVE_FAILED_TEXT = 'Не удалось сохранить результаты. Попробуйте ответить ещё раз или отправьте /start'
 
 
-def check_age_category(user_id: int):
-    """User age check
+async def get_question(user_id, state: FSMContext) -> Optional[Question]:
+    """Getting a question for a user
 
     :param user_id: Telegram user id
-    :return: age category
+    :param state: state object
+    :return: Question object or None if all questions have been answered
     """
-    session = Session()
-    with session:
-        user = session.query(Results).filter_by(user_id=user_id).first()
+    state_data = await state.get_data()
+    question_bank = get_question_bank(state_data.get('age_category'))
 
-        return user.age_category
+    return question_bank.get(state_data.get('current_question'))
 
 
-async def update_factor_based_on_age_and_question(age_category: str, question_number: int, state: FSMContext):
-    """Updates the factor in the user's state based on the age category and question number.
+async def finish_survey(user_id, state: FSMContext):
+    """Survey completion message
 
-    :param age_category: Age category ('14-15 years old' or '16-18 years old')
-    :param question_number: Current issue number
-    :param state: User state
+    :param user_id: Telegram user id
+    :param state: state object
+    :return:
     """
+    await bot.send_message(
+        user_id,
+        'Спасибо, опрос завершен! Хорошего дня :)\n\nНашли ошибку или баг? Нажми /bug_report'
+    )
+    await state.finish()
+
+
+async def resume_survey(message: types.Message, state: FSMContext):
+    """Resending the last unanswered question of an interrupted survey
 
-    age_category_mapping = {
-        AGE_CATEGORY_LOW: {
-            (1, 13): 'family_factor',
-            (14, 30): 'psychological_factor',
-            (31, 46): 'env_factor',
-            (47, 53): 'school_factor',
-        },
-        AGE_CATEGORY_HIGH: {
-            (1, 16): 'family_factor',
-            (17, 30): 'psychological_factor',
-            (31, 47): 'env_factor',
-            (48, 54): 'school_factor',
-        }
+    :param message: message object
+    :param state: state object
+    :return:
+    """
+    data = await state.get_data()
+    question_bank = get_question_bank(data.get('age_category'))
+    question_data = question_bank.get(data.get('current_question', 1) - 1)
+    if question_data is None:
+        await message.answer('Извините, Вы уже прошли тестирование', reply_markup=ReplyKeyboardRemove())
+        return
+
+    keyboard = get_answer_keyboard(data.get('age_category'), question_data)
+    await message.answer(question_data.text, reply_markup=keyboard)
+
+
+def rebuild_survey_data(age_category: str, answers: Iterable[Tuple[int, int]]) -> dict:
+    """Survey FSM data rebuilt from the answer log
+
+    The survey continues after the last question answered without a gap,
+    a question answered several times is counted once, with the last answer.
+
+    :param age_category: question bank, 'low' / 'high'
+    :param answers: (question number, points) pairs in answer order
+    :return: age_category, scores and current_question values
+    """
+    points_by_question = dict(answers)
+    answered = 0
+    while answered + 1 in points_by_question:
+        answered += 1
+
+    results = score_answers(age_category, ((number, points_by_question[number]) for number in range(1, answered + 1)))
+    return {
+        'age_category': age_category,
+        'scores': {factor: results[factor] for factor in FACTORS},
+        'current_question': answered + 2,
+        'logged_question': answered,
     }
-    factors_dict = age_category_mapping.get(age_category)
-    for number_range, factor in factors_dict.items():
-        low = number_range[0]
-        high = number_range[1]
-        if low <= question_number <= high:
-            await state.update_data(factor=factor)
-            break
 
 
-async def get_question(user_id, state: FSMContext):
-    """Getting a question for a user
+async def save_survey(user: AsyncUser, scores: dict) -> bool:
+    """Saving the results of an answered survey
 
-    :param user_id: Telegram user id
-    :param state: state object
-    :return: Question object
+    With SURVEY_SAVE_MODE=final the factor totals are written together with
+    the results, with SURVEY_SAVE_MODE=per_answer they are already in the database.
+
+    :param user: AsyncUser object
+    :param scores: factor name -> accumulated points
+    :return: True if the results were saved
     """
-    state_data = await state.get_data()
-    age_category = state_data.get('age_category')
-    if age_category == 'low':
-        with open('bot_app/questions/14_15_questions.json', 'r') as file:
-            json_data = json.load(file)
-    else:
-        with open('bot_app/questions/16_18_questions.json', 'r') as file:
-            json_data = json.load(file)
+    if SURVEY_SAVE_MODE == 'final':
+        return await user.save_results(scores)
+    await user.set_results()
+    return True
 
-    questions = json_data.get('questions')
 
-    current_question_number = state_data.get('current_question')
+async def restore_survey(message: types.Message, state: FSMContext, user: AsyncUser, age_category: str,
+                         answers: List[Tuple[str, int, int]]):
+    """Continuing a survey whose FSM state was lost, e.g. with MemoryStorage after a restart
 
-    for question in questions:
-        if question.get('number') == current_question_number:
-            question_data = Question(
-                number=question.get('number'),
-                text=question.get('text'),
-                answers=question.get('answers')
-            )
-            return question_data
-    else:
-        await bot.send_message(
-            user_id,
-            'Спасибо, опрос завершен! Хорошего дня :)\n\nНашли ошибку или баг? Нажми /bug_report'
-        )
-        await state.finish()
+    :param message: message object
+    :param state: state object
+    :param user: AsyncUser object
+    :param age_category: age category of the user, '14-15 лет' / '16-18 лет'
+    :param answers: (bank, question number, points) of the logged answers
+    :return:
+    """
+    bank = 'low' if age_category == AGE_CATEGORY_LOW else 'high'
+    data = rebuild_survey_data(bank, ((number, points) for answer_bank, number, points in answers
+                                      if answer_bank == bank))
+    await state.set_state(RegistrationStates.survey_question)
+    await state.update_data(**data)
+
+    if get_question_bank(bank).get(data['current_question'] - 1) is not None:
+        await resume_survey(message, state)
+        return
+
+    # Every question was answered, only the results were not saved
+    if not await save_survey(user, data['scores']):
+        await message.answer(SAVE_FAILED_TEXT, reply_markup=ReplyKeyboardRemove())
+        return
+    await finish_survey(message.from_user.id, state)
 
 
 async def cmd_start(message: types.Message, state: FSMContext):
     """Handler processing start command
 
+    A registered user without saved results continues the survey. If the
+    FSM state was lost, the survey is rebuilt from the answer log; if the
+    registration was not finished, it is started again.
+
     :param message: message object
     :param state: state object
     :return:
@@ -110,16 +150,23 @@ async def cmd_start(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     username = message.from_user.username
 
-    session = Session()
-    with (session):
-        user = session.query(Results).filter_by(user_id=user_id).first()
-        if user is None:
-            user = User(user_id=user_id)
-            user.add_user(username=username)
-        else:
+    user = AsyncUser(user_id=user_id)
+    if not await user.exists():
+        await user.add_user(username=username)
+    elif await state.get_state() == RegistrationStates.survey_question.state:
+        await resume_survey(message, state)
+        return
+    else:
+        survey = await user.get_unfinished_survey()
+        if survey is None:
             await message.answer('Извините, Вы уже прошли тестирование', reply_markup=ReplyKeyboardRemove())
             return
 
+        age_category, answers = survey
+        if age_category is not None:
+            await restore_survey(message, state, user, age_category, answers)
+            return
+
     await message.answer("Добро пожаловать! Введите Ваше имя", reply_markup=ReplyKeyboardRemove())
     await state.set_state(RegistrationStates.get_name)
 
@@ -140,117 +187,143 @@ async def start_survey(message: types.Message, state: FSMContext):
     )
 
     user_id = message.from_user.id
-    session = Session()
-    with session:
-        user = session.query(Results).filter_by(user_id=user_id).first()
-
-        if message.text == AGE_CATEGORY_LOW:
-            user.age_category = AGE_CATEGORY_LOW
-            session.commit()
-
-            await state.update_data(current_question=1, age_category='low')
-        elif message.text == AGE_CATEGORY_HIGH:
-            user.age_category = AGE_CATEGORY_HIGH
-            session.commit()
-
-            await state.update_data(current_question=1, age_category='high')
-        else:
-            await message.answer('Выберите один из предложенных вариантов')
-            return
+    user = AsyncUser(user_id=user_id)
 
-        question_data = await get_question(message.from_user.id, state)
+    if message.text == AGE_CATEGORY_LOW:
+        await user.set_age_category(AGE_CATEGORY_LOW)
 
-        await state.update_data(factor='family_factor')
+        await state.update_data(current_question=1, age_category='low')
+    elif message.text == AGE_CATEGORY_HIGH:
+        await user.set_age_category(AGE_CATEGORY_HIGH)
 
-        data = await state.get_data()
-        factor = data.get('factor')
-        answers = question_data.answers
+        await state.update_data(current_question=1, age_category='high')
+    else:
+        await message.answer('Выберите один из предложенных вариантов')
+        return
 
-        keyboard = create_answer_keyboard(user_id, factor, answers)
-        await message.answer(question_data.text, reply_markup=keyboard)
+    question_data = await get_question(message.from_user.id, state)
 
-        await state.update_data(
-            answer=question_data.answers,
-            current_question=question_data.number + 1,
-            message_id=message.message_id
-        )
+    data = await state.get_data()
 
-        await state.set_state(RegistrationStates.survey_question)
+    keyboard = get_answer_keyboard(data.get('age_category'), question_data)
+    await message.answer(question_data.text, reply_markup=keyboard)
 
+    await state.update_data(
+        scores=dict.fromkeys(FACTORS, 0),
+        current_question=question_data.number + 1,
+        message_id=message.message_id
+    )
 
-async def survey_question(callback_query: types.CallbackQuery, state: FSMContext, callback_data: dict):
-    """Response processing
+    await state.set_state(RegistrationStates.survey_question)
 
-    :param callback_query: callback_query object
-    :param state: state object
-    :param callback_data: user_id, factor, points
+
+async def replace_question(message: types.Message, age_category: str, question_data: Question):
+    """Showing the next question instead of the answered one
+
+    With SURVEY_MESSAGE_MODE=edit the answered message is edited in place,
+    which takes one Bot API call. If it can't be edited, or with
+    SURVEY_MESSAGE_MODE=resend, a new message is sent and the old one is deleted.
+
+    :param message: message with the answered question
+    :param age_category: question bank age category
+    :param question_data: next question
     :return:
     """
-    from db.db_engine import User
+    keyboard = get_answer_keyboard(age_category, question_data)
+
+    if SURVEY_MESSAGE_MODE == 'edit':
+        try:
+            await bot.edit_message_text(
+                question_data.text,
+                chat_id=message.chat.id,
+                message_id=message.message_id,
+                reply_markup=keyboard
+            )
+            return
+        except TelegramAPIError as ex:
+            logger.warning(f'Question message was not edited: {ex}')
 
-    question_data = await get_question(callback_query.from_user.id, state)
+    await bot.send_message(message.chat.id, question_data.text, reply_markup=keyboard)
+    await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id)
 
-    age_category = check_age_category(callback_query.from_user.id)
 
-    if question_data:
-        await update_factor_based_on_age_and_question(
-            age_category=age_category,
-            question_number=question_data.number,
-            state=state
-        )
+async def survey_question(callback_query: types.CallbackQuery, state: FSMContext, answer: AnswerPayload):
+    """Response processing
 
-        answers = question_data.answers
+    The factor and points are taken from the question bank by the question
+    number and answer index of the pressed button. Buttons of questions
+    other than the last sent one are ignored.
 
-        data = await state.get_data()
-        factor = data['factor']
+    Every answer is also buffered in the answer log, which writes the
+    ``answers`` table in batches. The last answer is logged once, even if it
+    is given again after a failed final save.
 
-        user_id = callback_data['user_id']
-        points = callback_data['points']
+    With SURVEY_SAVE_MODE=final the points are accumulated in the state and
+    written to the database once, when the last question is answered.
+    With SURVEY_SAVE_MODE=per_answer every answer is written immediately.
 
-        user = User(
-            user_id=user_id
-        )
-        user.edit_factor(
+    :param callback_query: callback_query object
+    :param state: state object
+    :param answer: question number and answer index
+    :return:
+    """
+    user_id = callback_query.from_user.id
+
+    data = await state.get_data()
+    age_category = data.get('age_category')
+    question_bank = get_question_bank(age_category)
+
+    answered_question = question_bank.get(answer.question_number)
+    if (answered_question is None
+            or answer.question_number != data.get('current_question', 0) - 1
+            or answer.answer_index >= len(answered_question.answers)):
+        await callback_query.answer()
+        return
+
+    factor = get_question_factor(age_category, answer.question_number)
+    points = answered_question.answers[answer.answer_index].points
+    if data.get('logged_question') != answer.question_number:
+        answer_log.add(user_id, age_category, answer.question_number, answer.answer_index, points)
+
+    user = AsyncUser(
+        user_id=user_id
+    )
+    scores = data.get('scores') or dict.fromkeys(FACTORS, 0)
+    if SURVEY_SAVE_MODE == 'final':
+        scores[factor] = scores.get(factor, 0) + points
+    else:
+        await user.edit_factor(
             factor=factor,
             value=points
         )
 
+    question_data = question_bank.get(answer.question_number + 1)
+
+    if question_data:
         await callback_query.answer()
 
-        keyboard = create_answer_keyboard(callback_query.from_user.id, factor, answers)
-        await bot.send_message(callback_query.from_user.id, question_data.text, reply_markup=keyboard)
+        await replace_question(callback_query.message, age_category, question_data)
 
         await state.update_data(
-            answer=question_data.answers,
+            scores=scores,
             current_question=question_data.number + 1,
             message_id=callback_query.message.message_id
         )
-
-        await bot.delete_message(
-            chat_id=callback_query.from_user.id, message_id=callback_query.message.message_id
-        )
-
-        await state.set_state(RegistrationStates.survey_question)
     else:
-        user_id = callback_data['user_id']
-        factor = callback_data['factor']
-        points = callback_data['points']
+        if not await save_survey(user, scores):
+            # The question is kept, the answer can be sent again or the survey
+            # finished after /start, the answer is already in the answer log
+            await state.update_data(logged_question=answer.question_number)
+            await callback_query.answer(SAVE_FAILED_TEXT, show_alert=True)
+            return
 
         await bot.delete_message(
-            chat_id=callback_query.from_user.id,
+            chat_id=user_id,
             message_id=callback_query.message.message_id
         )
-
-        user = User(
-            user_id=user_id
-        )
-        user.edit_factor(
-            factor=factor,
-            value=points
-        )
-
         await callback_query.answer()
-        user.set_results()
+
+        await finish_survey(user_id, state)
 
 
 def register_handlers_common(dp: Dispatcher):
@@ -259,7 +332,6 @@ def register_handlers_common(dp: Dispatcher):
     :param dp: Dispatcher object
     :return:
     """
-    dp.register_message_handler(cmd_start, commands=['start'])
+    dp.register_message_handler(cmd_start, commands=['start'], state=[None, RegistrationStates.survey_question])
     dp.register_message_handler(start_survey, state=RegistrationStates.start_survey)
-    dp.register_callback_query_handler(survey_question, ANSWER_CALLBACK_DATA.filter(),
-                                       state=RegistrationStates.survey_question)
+    dp.register_callback_query_handler(survey_question, answer_filter, state=RegistrationStates.survey_question)
@@ -0,0 +1,62 @@
+import base64
+import binascii
+import struct
+from typing import NamedTuple, Optional, Union
+
+from aiogram import types
+
+ANSWER_PREFIX = 'a'
+ANSWER_CODEC_VERSION = 1
+
+# version, question number, answer index
+_ANSWER_STRUCT = struct.Struct('>BHB')
+
+
+class AnswerPayload(NamedTuple):
+    """Decoded answer button payload"""
+    question_number: int
+    answer_index: int
+
+
+def encode_answer(question_number: int, answer_index: int) -> str:
+    """Packing an answer into callback data
+
+    The payload is the prefix and 4 bytes in urlsafe base64, 7 characters
+    in total, regardless of the question text or factor names.
+
+    :param question_number: question number
+    :param answer_index: index of the answer in the question
+    :return: callback data
+    """
+    packed = _ANSWER_STRUCT.pack(ANSWER_CODEC_VERSION, question_number, answer_index)
+    return ANSWER_PREFIX + base64.urlsafe_b64encode(packed).rstrip(b'=').decode()
+
+
+def decode_answer(data: Optional[str]) -> Optional[AnswerPayload]:
+    """Unpacking callback data of an answer button
+
+    :param data: callback data
+    :return: AnswerPayload or None if the data is not an answer of the current version
+    """
+    # Callback data is sent by the client, anything but ASCII is not an answer
+    if not data or len(data) != 7 or data[0] != ANSWER_PREFIX or not data.isascii():
+        return None
+    try:
+        version, question_number, answer_index = _ANSWER_STRUCT.unpack(base64.urlsafe_b64decode(data[1:] + '=='))
+    except (binascii.Error, struct.error):
+        return None
+    if version != ANSWER_CODEC_VERSION:
+        return None
+    return AnswerPayload(question_number=question_number, answer_index=answer_index)
+
+
+def answer_filter(callback_query: types.CallbackQuery) -> Union[dict, bool]:
+    """Callback query filter passing the decoded answer to the handler
+
+    :param callback_query: callback_query object
+    :return: {'answer': AnswerPayload} or False
+    """
+    answer = decode_answer(callback_query.data)
+    if answer is None:
+        return False
+    return {'answer': answer}
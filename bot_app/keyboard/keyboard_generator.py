@@ -1,39 +1,59 @@
-from typing import Union
+from typing import Dict, Tuple
 
 from aiogram import types
 from aiogram.types import ReplyKeyboardMarkup
 from aiogram.utils.callback_data import CallbackData
 
-ANSWER_CALLBACK_DATA = CallbackData('answers', 'user_id', 'factor', 'points')
+from bot_app.keyboard.answer_codec import encode_answer
+from bot_app.question_bank import Question
+
 BUG_REPORT_CALLBACK_DATA = CallbackData('bug_report', 'user_id')
 
+# (age category, question number) -> (question, keyboard)
+_answer_keyboards: Dict[Tuple[str, int], Tuple[Question, types.InlineKeyboardMarkup]] = {}
+
 
-def create_answer_keyboard(user_id: int | str, factor: str, answers: list) -> types.InlineKeyboardMarkup:
+def create_answer_keyboard(question: Question) -> types.InlineKeyboardMarkup:
     """Create answer InlineKeyboard
 
-    :param user_id: Telegram user id
-    :param factor: psychological factor
-    :param answers: answers variants list
+    :param question: Question object
     :return: types.InlineKeyboardMarkup
     """
 
     keyboard = types.InlineKeyboardMarkup(resize_keyboard=True)
 
-    for answer in answers:
+    for answer_index, answer in enumerate(question.answers):
         keyboard.add(
             types.InlineKeyboardButton(
-                text=answer.get('text'),
-                callback_data=ANSWER_CALLBACK_DATA.new(
-                    user_id=user_id,
-                    factor=factor,
-                    points=answer.get('points')
-                )
+                text=answer.text,
+                callback_data=encode_answer(question.number, answer_index)
             )
         )
 
     return keyboard
 
 
+def get_answer_keyboard(age_category: str, question: Question) -> types.InlineKeyboardMarkup:
+    """Getting a prebuilt answer InlineKeyboard
+
+    Keyboards do not depend on the user, so one keyboard per question is
+    built and reused. The keyboard is rebuilt if the question bank was
+    reloaded.
+
+    :param age_category: question bank age category
+    :param question: Question object
+    :return: types.InlineKeyboardMarkup
+    """
+    key = (age_category, question.number)
+    cached = _answer_keyboards.get(key)
+    if cached is not None and cached[0] is question:
+        return cached[1]
+
+    keyboard = create_answer_keyboard(question)
+    _answer_keyboards[key] = (question, keyboard)
+    return keyboard
+
+
 def create_bug_report_keyboard(user_id: int | str) -> types.InlineKeyboardMarkup:
     """Create bug report InlineKeyboard
 
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import time
+from typing import NamedTuple, Optional
+
+QUESTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questions')
+RELOAD_CHECK_INTERVAL = float(os.getenv('QUESTIONS_RELOAD_INTERVAL', 5))
+
+logger = logging.getLogger('questions')
+
+
+class Answer(NamedTuple):
+    """Answer representation"""
+    text: str
+    points: int
+
+
+class Question(NamedTuple):
+    """Question representation"""
+    number: int
+    text: str
+    answers: tuple
+
+
+class QuestionBank:
+    """Immutable, number-indexed set of questions loaded from a JSON file
+
+    Questions are parsed once and stored in a tuple indexed by question number,
+    so a lookup does not touch the file. The file mtime is checked at most once
+    per ``check_interval`` seconds and the bank is rebuilt if it has changed.
+    If the changed file can not be loaded, the previous questions are kept.
+    """
+
+    def __init__(self, file_path: str, check_interval: float = RELOAD_CHECK_INTERVAL):
+        self.file_path = file_path
+        self.check_interval = check_interval
+        self._questions: tuple = ()
+        self._mtime: float = 0.0
+        self._last_check: float = 0.0
+        self.load()
+
+    def load(self):
+        """Read the JSON file and rebuild the index
+
+        :return:
+        """
+        mtime = os.path.getmtime(self.file_path)
+        with open(self.file_path, 'r', encoding='utf-8') as file:
+            json_data = json.load(file)
+
+        questions = {}
+        for question in json_data.get('questions'):
+            number = question.get('number')
+            questions[number] = Question(
+                number=number,
+                text=question.get('text'),
+                answers=tuple(
+                    Answer(text=answer.get('text'), points=int(answer.get('points')))
+                    for answer in question.get('answers')
+                )
+            )
+
+        # Slot 0 is unused, question numbers start at 1
+        index = [None] * (max(questions, default=0) + 1)
+        for number, question in questions.items():
+            index[number] = question
+
+        self._questions = tuple(index)
+        self._mtime = mtime
+        self._last_check = time.monotonic()
+
+    def reload_if_changed(self) -> bool:
+        """Reload the bank if the file was modified since the last load
+
+        :return: True if the bank was reloaded
+        """
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+
+        try:
+            mtime = os.path.getmtime(self.file_path)
+        except OSError:
+            return False
+
+        if mtime == self._mtime:
+            return False
+
+        try:
+            self.load()
+        except (OSError, ValueError, TypeError) as ex:
+            # A half-written or invalid file, the old questions are served and
+            # the reload is tried again after check_interval
+            logger.error(f'Failed to reload {self.file_path}: {ex!r}')
+            return False
+        return True
+
+    def get(self, number: Optional[int]) -> Optional[Question]:
+        """Getting a question by its number
+
+        :param number: question number
+        :return: Question object or None if there is no such question
+        """
+        if number is None or not 0 < number < len(self._questions):
+            return None
+        return self._questions[number]
+
+    def __len__(self):
+        return len(self._questions) - 1 if self._questions else 0
+
+
+QUESTION_BANKS = {
+    'low': QuestionBank(os.path.join(QUESTIONS_DIR, '14_15_questions.json')),
+    'high': QuestionBank(os.path.join(QUESTIONS_DIR, '16_18_questions.json')),
+}
+
+
+def get_question_bank(age_category: str) -> QuestionBank:
+    """Getting the question bank for the age category stored in the user's state
+
+    :param age_category: 'low' or 'high'
+    :return: QuestionBank object
+    """
+    bank = QUESTION_BANKS['low'] if age_category == 'low' else QUESTION_BANKS['high']
+    bank.reload_if_changed()
+    return bank
@@ -93,16 +93,16 @@ async def confirmation(message: types.Message, state: FSMContext):
     :param state: state object
     :return:
     """
-    from db.db_engine import User
+    from db.async_db import AsyncUser
 
     if message.text == 'Да':
         student = await get_student_info(state)
         user_id = message.from_user.id
         try:
-            user = User(
+            user = AsyncUser(
                 user_id=user_id
             )
-            user.add_user_info(student)
+            await user.add_user_info(student)
 
             keyboard = create_reply_keyboard('14-15 лет', '16-18 лет')
             await message.answer(
@@ -0,0 +1,159 @@
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+AGE_CATEGORY_LOW = '14-15 лет'
+AGE_CATEGORY_HIGH = '16-18 лет'
+
+FACTORS = ('family_factor', 'psychological_factor', 'env_factor', 'school_factor')
+RESULT_FIELDS = FACTORS + ('total_risk',)
+BANDS = ('Низкая', 'Средняя', 'Высокая')
+
+
+class ScoringTables(NamedTuple):
+    """Compiled scoring tables of one age category"""
+    # Result field -> upper bounds of the 'Низкая' and 'Средняя' bands
+    band_bounds: Dict[str, Tuple[int, ...]]
+    # Question number -> factor, slot 0 is unused
+    question_factors: Tuple[Optional[str], ...]
+
+
+def _compile_question_factors(ranges: Mapping[Tuple[int, int], str]) -> Tuple[Optional[str], ...]:
+    """Turning question number ranges into a direct-index table
+
+    :param ranges: (first, last) question number -> factor
+    :return: table indexed by question number
+    """
+    table = [None] * (max(high for _, high in ranges) + 1)
+    for (low, high), factor in ranges.items():
+        for number in range(low, high + 1):
+            table[number] = factor
+    return tuple(table)
+
+
+SCORING_TABLES = {
+    AGE_CATEGORY_LOW: ScoringTables(
+        band_bounds={
+            'family_factor': (15, 26),
+            'psychological_factor': (20, 37),
+            'env_factor': (24, 41),
+            'school_factor': (9, 14),
+            'total_risk': (68, 118),
+        },
+        question_factors=_compile_question_factors({
+            (1, 13): 'family_factor',
+            (14, 30): 'psychological_factor',
+            (31, 46): 'env_factor',
+            (47, 53): 'school_factor',
+        }),
+    ),
+    AGE_CATEGORY_HIGH: ScoringTables(
+        band_bounds={
+            'family_factor': (17, 33),
+            'psychological_factor': (16, 37),
+            'env_factor': (22, 42),
+            'school_factor': (10, 16),
+            'total_risk': (65, 128),
+        },
+        question_factors=_compile_question_factors({
+            (1, 16): 'family_factor',
+            (17, 30): 'psychological_factor',
+            (31, 47): 'env_factor',
+            (48, 54): 'school_factor',
+        }),
+    ),
+}
+
+# Age category as it is stored in the FSM data
+STATE_AGE_CATEGORIES = {'low': AGE_CATEGORY_LOW, 'high': AGE_CATEGORY_HIGH}
+
+
+def get_scoring_tables(age_category: Optional[str]) -> ScoringTables:
+    """Getting the scoring tables of the age category
+
+    Accepts both '14-15 лет'/'16-18 лет' and 'low'/'high',
+    an unknown category is scored as 16-18.
+
+    :param age_category: age category
+    :return: ScoringTables object
+    """
+    age_category = STATE_AGE_CATEGORIES.get(age_category, age_category)
+    if age_category == AGE_CATEGORY_LOW:
+        return SCORING_TABLES[AGE_CATEGORY_LOW]
+    return SCORING_TABLES[AGE_CATEGORY_HIGH]
+
+
+def get_question_factor(age_category: Optional[str], question_number: int) -> Optional[str]:
+    """Getting the factor a question belongs to
+
+    Questions after the last range are counted to the last factor.
+
+    :param age_category: age category
+    :param question_number: question number
+    :return: factor name or None for an invalid question number
+    """
+    question_factors = get_scoring_tables(age_category).question_factors
+    if question_number < 1:
+        return None
+    return question_factors[min(question_number, len(question_factors) - 1)]
+
+
+def score(age_category: Optional[str], scores: Mapping[str, int]) -> Dict[str, object]:
+    """Calculating total risk and result bands from factor totals
+
+    :param age_category: age category
+    :param scores: factor name -> points
+    :return: total_risk and <field>_result values
+    """
+    band_bounds = get_scoring_tables(age_category).band_bounds
+
+    values = {factor: int(scores.get(factor) or 0) for factor in FACTORS}
+    values['total_risk'] = sum(values.values())
+
+    results: Dict[str, object] = {'total_risk': values['total_risk']}
+    for field in RESULT_FIELDS:
+        results[field + '_result'] = BANDS[bisect_left(band_bounds[field], values[field])]
+    return results
+
+
+def score_answers(age_category: Optional[str], answers: Iterable[Tuple[int, int]]) -> Dict[str, object]:
+    """Calculating results from item-level answers
+
+    :param age_category: age category
+    :param answers: (question number, points) pairs
+    :return: factor totals, total_risk and <field>_result values
+    """
+    scores = dict.fromkeys(FACTORS, 0)
+    for question_number, points in answers:
+        factor = get_question_factor(age_category, question_number)
+        if factor is not None:
+            scores[factor] += points
+
+    return {**scores, **score(age_category, scores)}
+
+
+def score_batch(rows: Sequence[Sequence]) -> List[Tuple]:
+    """Scoring many respondents at once
+
+    Every row is (age_category, family_factor, psychological_factor,
+    env_factor, school_factor). The tables are looked up once per age
+    category, not per row.
+
+    :param rows: respondents
+    :return: (total_risk, family_factor_result, psychological_factor_result,
+        env_factor_result, school_factor_result, total_risk_result) per row
+    """
+    bounds_by_category = {}
+    results = []
+    for age_category, *factor_values in rows:
+        bounds = bounds_by_category.get(age_category)
+        if bounds is None:
+            band_bounds = get_scoring_tables(age_category).band_bounds
+            bounds = bounds_by_category[age_category] = tuple(band_bounds[field] for field in RESULT_FIELDS)
+
+        values = [int(value or 0) for value in factor_values]
+        total_risk = sum(values)
+        values.append(total_risk)
+        results.append(
+            (total_risk,) + tuple(BANDS[bisect_left(bound, value)] for bound, value in zip(bounds, values))
+        )
+    return results
@@ -1,21 +1,42 @@
-import logging
 import os
 
-from aiogram import Bot, Dispatcher
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.bot.api import TELEGRAM_PRODUCTION, TelegramAPIServer
 from aiogram.contrib.middlewares.logging import LoggingMiddleware
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from dotenv import load_dotenv
 
+from dispatching.rate_limiter import RateLimitedBot
+from dispatching.update_queue import OrderedDispatcher
+from logs.logger import configure_logging
+from middlewares.database import DatabaseMiddleware
+from middlewares.log_sampling import LogSamplingMiddleware
+from middlewares.metrics import MetricsMiddleware
+from middlewares.throttling import ThrottlingMiddleware
+from middlewares.tracing import TracingMiddleware
+from storage.fsm_storage import create_storage
+
 load_dotenv()
 API_TOKEN = os.getenv('BOT_TOKEN')
+BOT_API_URL = os.getenv('BOT_API_URL')
+POLLING_LANES = int(os.getenv('POLLING_LANES', 8))
+POLLING_QUEUE_SIZE = int(os.getenv('POLLING_QUEUE_SIZE', 100))
 
-storage = MemoryStorage()
+storage = create_storage()
 
-bot = Bot(token=API_TOKEN)
-dp = Dispatcher(bot, storage=storage)
-logging.basicConfig(level=logging.INFO)
+bot = RateLimitedBot(
+    token=API_TOKEN,
+    server=TelegramAPIServer.from_base(BOT_API_URL) if BOT_API_URL else TELEGRAM_PRODUCTION
+)
+dp = OrderedDispatcher(bot, storage=storage)
+configure_logging()
+dp.middleware.setup(LogSamplingMiddleware())
 dp.middleware.setup(LoggingMiddleware())
+# Rejected updates are cancelled in pre-processing, the middlewares after
+# the throttling never see them
+dp.middleware.setup(ThrottlingMiddleware())
+dp.middleware.setup(MetricsMiddleware())
+dp.middleware.setup(TracingMiddleware())
+dp.middleware.setup(DatabaseMiddleware())
 
 
 class RegistrationStates(StatesGroup):
@@ -40,9 +61,24 @@ if __name__ == '__main__':
     from bot_app.registration import register_handlers_registration
     from bot_app.common import register_handlers_common
     from bot_app.bug_report import bug_report_register_handlers
+    from bot_app.admin import admin_register_handlers
+
+    from db.answer_log import answer_log
+    from db.db_engine import get_engine
+
+    async def on_startup(dispatcher: OrderedDispatcher):
+        get_engine()
+        answer_log.start()
+        if POLLING_LANES > 0:
+            dispatcher.start_lanes(lanes=POLLING_LANES, maxsize=POLLING_QUEUE_SIZE)
+
+    async def on_shutdown(dispatcher: OrderedDispatcher):
+        await dispatcher.stop_lanes()
+        await answer_log.stop()
 
     register_handlers_common(dp)
     register_handlers_registration(dp)
     bug_report_register_handlers(dp)
+    admin_register_handlers(dp)
 
-    executor.start_polling(dp, skip_updates=True)
+    executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from db.async_db import run_sync
+from db.db_engine import insert_answers
+
+ANSWER_LOG_ENABLED = os.getenv('ANSWER_LOG', '1') == '1'
+ANSWER_LOG_BATCH_SIZE = int(os.getenv('ANSWER_LOG_BATCH_SIZE', 500))
+ANSWER_LOG_FLUSH_INTERVAL = float(os.getenv('ANSWER_LOG_FLUSH_INTERVAL', 1))
+ANSWER_LOG_MAX_PENDING = int(os.getenv('ANSWER_LOG_MAX_PENDING', 50000))
+
+logger = logging.getLogger('postgres')
+
+
+class AnswerLogBuffer:
+    """Write-behind buffer of item-level answers
+
+    ``add`` only appends the answer to memory. The buffer is written to the
+    ``answers`` table when it reaches ``batch_size`` rows and every
+    ``flush_interval`` seconds, one transaction per flush. Rows of a failed
+    flush are kept for the next one, up to ``max_pending`` rows.
+    """
+
+    def __init__(self, batch_size: int = ANSWER_LOG_BATCH_SIZE, flush_interval: float = ANSWER_LOG_FLUSH_INTERVAL,
+                 max_pending: int = ANSWER_LOG_MAX_PENDING, enabled: bool = ANSWER_LOG_ENABLED):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.enabled = enabled
+        self._rows: List[dict] = []
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._flushes: Set[asyncio.Task] = set()
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def add(self, user_id: int, bank: str, question_number: int, answer_index: int, points: int):
+        """Buffering an answer
+
+        :param user_id: Telegram user id
+        :param bank: question bank, 'low' / 'high'
+        :param question_number: question number
+        :param answer_index: index of the chosen answer
+        :param points: points of the answer
+        :return:
+        """
+        if not self.enabled:
+            return
+
+        self._rows.append({
+            'user_id': user_id,
+            'bank': bank,
+            'question_number': question_number,
+            'answer_index': answer_index,
+            'points': points,
+            'answered_at': datetime.now(timezone.utc),
+        })
+        if len(self._rows) >= self.batch_size and not self._lock.locked():
+            task = asyncio.create_task(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def flush(self):
+        """Writing the buffered answers
+
+        :return:
+        """
+        async with self._lock:
+            while self._rows:
+                rows, self._rows = self._rows[:self.batch_size], self._rows[self.batch_size:]
+                try:
+                    await run_sync(insert_answers, rows)
+                    self.written += len(rows)
+                    continue
+                except (IntegrityError, DataError) as ex:
+                    logger.warning(f'Answers were rejected, writing them one by one: {ex}')
+                    unwritten, error = await self._write_one_by_one(rows)
+                except Exception as ex:
+                    unwritten, error = rows, ex
+                if unwritten:
+                    self.failed_flushes += 1
+                    logger.error(f'Answers were not written: {error}')
+                    self._requeue(unwritten)
+                    return
+
+    async def _write_one_by_one(self, rows: List[dict]) -> Tuple[List[dict], Optional[Exception]]:
+        """Writing the rows of a rejected batch one by one, the rejected rows are dropped
+
+        :param rows: answers of the rejected batch
+        :return: rows left after an error other than a rejected row and the error
+        """
+        for position, row in enumerate(rows):
+            try:
+                await run_sync(insert_answers, [row])
+            except (IntegrityError, DataError) as ex:
+                self.dropped += 1
+                logger.error(f'Answer was dropped: {row}: {ex}')
+            except Exception as ex:
+                return rows[position:], ex
+            else:
+                self.written += 1
+        return [], None
+
+    def _requeue(self, rows: List[dict]):
+        self._rows = rows + self._rows
+        overflow = len(self._rows) - self.max_pending
+        if overflow > 0:
+            del self._rows[:overflow]
+            self.dropped += overflow
+            logger.warning(f'Answer log is full, {overflow} oldest answers dropped')
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        """Start the periodic flush
+
+        :return:
+        """
+        if self.enabled and self._timer is None:
+            self._timer = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        """Stop the periodic flush and write the remaining answers
+
+        :return:
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            await asyncio.gather(self._timer, return_exceptions=True)
+            self._timer = None
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+        await self.flush()
+
+    def pending(self) -> int:
+        """Number of answers waiting to be written
+
+        :return:
+        """
+        return len(self._rows)
+
+    def stats(self) -> dict:
+        """Buffer counters
+
+        :return:
+        """
+        return {
+            'pending': self.pending(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed_flushes': self.failed_flushes,
+        }
+
+
+answer_log = AnswerLogBuffer()
@@ -0,0 +1,95 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple, TypeVar, Union
+
+from db.cache import registered_users
+from db.db_engine import User
+from monitoring.tracing import span
+
+if TYPE_CHECKING:
+    # bot_app.registration imports bot_main, which installs the database middleware
+    from bot_app.registration import Student
+
+DB_THREAD_POOL_SIZE = int(os.getenv('DB_THREAD_POOL_SIZE', 10))
+
+T = TypeVar('T')
+
+_executor = ThreadPoolExecutor(max_workers=DB_THREAD_POOL_SIZE, thread_name_prefix='db')
+
+
+async def run_sync(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking database call in the database thread pool
+
+    The current context is copied into the worker thread, so context variables
+    set for the update are visible to the database code.
+
+    :param func: blocking function
+    :return: function result
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    with span('db', func.__name__):
+        return await loop.run_in_executor(_executor, call)
+
+
+def shutdown_executor():
+    """Wait for the running database calls and stop the thread pool
+
+    :return:
+    """
+    _executor.shutdown(wait=True)
+
+
+class AsyncUser:
+    """Non-blocking counterpart of ``db.db_engine.User``
+
+    Every operation is executed in the database thread pool, so a slow
+    round trip does not block the event loop for other respondents.
+    A positive registration status is cached in process, a user who is
+    not registered yet is looked up again on the next check.
+    """
+
+    def __init__(self, user_id: Union[int, str]):
+        self.user_id = int(user_id)
+        self._user = User(user_id=user_id)
+
+    async def exists(self) -> bool:
+        if registered_users.get(self.user_id, False):
+            return True
+        # Only positive results are cached, a cached False would go stale as
+        # soon as the user registers, e.g. through another worker
+        exists = await run_sync(self._user.exists)
+        if exists:
+            registered_users.set(self.user_id, True)
+        return exists
+
+    async def get_unfinished_survey(self) -> Optional[Tuple[Optional[str], List[Tuple[str, int, int]]]]:
+        return await run_sync(self._user.get_unfinished_survey)
+
+    async def set_age_category(self, age_category: str):
+        await run_sync(self._user.set_age_category, age_category)
+
+    async def add_user(self, username: str):
+        await run_sync(self._user.add_user, username)
+
+    async def add_user_info(self, student: 'Student'):
+        await run_sync(self._user.add_user_info, student)
+
+    async def edit_factor(self, factor: str, value: Union[int, str]):
+        await run_sync(self._user.edit_factor, factor, value)
+
+    async def set_results(self):
+        await run_sync(self._user.set_results)
+
+    async def save_results(self, scores: Dict[str, int]) -> bool:
+        return await run_sync(self._user.save_results, scores)
+
+    async def add_bug_report(self, description: str):
+        await run_sync(self._user.add_bug_report, description)
+
+    async def edit_bug_report_status(self, status: str):
+        await run_sync(self._user.edit_bug_report_status, status)
@@ -0,0 +1,61 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 600))
+
+MISSING = object()
+
+
+class TTLCache:
+    """In-process LRU cache whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """Getting a cached value
+
+        :param key: cache key
+        :param default: returned if there is no fresh value
+        :return: cached value or default
+        """
+        item = self._data.get(key)
+        if item is None or item[1] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def set(self, key: Hashable, value: Any):
+        """Caching a value
+
+        :param key: cache key
+        :param value: value
+        :return:
+        """
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Cache size and hit counters
+
+        :return:
+        """
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+# user ids of registered users, a registration is never undone
+registered_users = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
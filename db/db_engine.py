@@ -1,29 +1,256 @@
 import os
-from typing import Union
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple, Union
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy import create_engine, delete, func, insert, literal, select, text, BigInteger, Column, DateTime, \
+    Index, Integer, SmallInteger, String, ForeignKey
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship, Session as SessionType
 
-from bot_app.registration import Student
+from bot_app.scoring import FACTORS, RESULT_FIELDS, score
 from logs.logger import get_logger
+from monitoring.metrics import instrument_engine
+
+if TYPE_CHECKING:
+    from bot_app.registration import Student
 
 logger = get_logger(
     logger_name='postgres',
     log_file_name='logs/database.log'
 )
 load_dotenv()
-DATABASE_URL = (f'postgresql://{os.getenv("POSTGRES_USER_NAME")}:{os.getenv("POSTGRES_USER_PASSWORD")}'
-                f'@{os.getenv("POSTGRES_HOST")}:{os.getenv("POSTGRES_PORT")}/{os.getenv("DATABASE_NAME")}')
+DATABASE_URL = os.getenv('DATABASE_URL') or (
+    f'postgresql://{os.getenv("POSTGRES_USER_NAME")}:{os.getenv("POSTGRES_USER_PASSWORD")}'
+    f'@{os.getenv("POSTGRES_HOST")}:{os.getenv("POSTGRES_PORT")}/{os.getenv("DATABASE_NAME")}'
+)
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
 
-engine = create_engine(DATABASE_URL)
-Session = sessionmaker(bind=engine)
+Session = sessionmaker(expire_on_commit=False)
 Base = declarative_base()
 
 
+def get_engine() -> Engine:
+    """Getting the engine, it is created on first use
+
+    Importing the module neither loads the database driver nor connects,
+    the entry points create the engine on startup.
+
+    :return: engine
+    """
+    global _engine
+    if _engine is None:
+        # Handlers run in the executor threads, the engine must be created once
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(
+                    DATABASE_URL,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE,
+                    pool_pre_ping=True
+                )
+                instrument_engine(engine)
+                _engine = engine
+    return _engine
+
+current_unit_of_work: ContextVar[Optional['UnitOfWork']] = ContextVar('current_unit_of_work', default=None)
+
+
+class UnitOfWork:
+    """Database session shared by all operations of one update
+
+    The session is opened on first use and every operation ends its
+    transaction, so the pooled connection is checked out only while a query
+    runs, not while the handler waits for the Bot API. Loaded ``Results`` rows
+    stay in the session identity map, so repeated ``session.get(Results, user_id)``
+    calls during the update do not query the database again.
+    """
+
+    def __init__(self):
+        self._session: Optional[SessionType] = None
+
+    @property
+    def opened(self) -> bool:
+        """Whether the session was used during the update"""
+        return self._session is not None
+
+    @property
+    def session(self) -> SessionType:
+        if self._session is None:
+            self._session = Session(bind=get_engine())
+        return self._session
+
+    def close(self):
+        """Closing the session and returning the connection to the pool
+
+        :return:
+        """
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+@contextmanager
+def session_scope() -> Iterator[SessionType]:
+    """Getting the session of the current unit of work or a new session
+
+    :return: session
+    """
+    unit_of_work = current_unit_of_work.get()
+    if unit_of_work is None:
+        session = Session(bind=get_engine())
+        with session:
+            yield session
+        return
+
+    session = unit_of_work.session
+    try:
+        yield session
+    except Exception:
+        session.rollback()
+        raise
+    if session.in_transaction():
+        # Returns the connection to the pool, the loaded rows are not expired
+        session.commit()
+
+
+def get_pool_stats() -> Dict[str, int]:
+    """Connection pool statistics
+
+    :return: pool size, idle, checked out and overflow connections
+    """
+    pool = get_engine().pool
+    return {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+    }
+
+
+def insert_answers(rows: List[dict]):
+    """Writing logged answers in one transaction
+
+    The rows are sent as multi-row INSERT statements, not one statement per row.
+
+    :param rows: SurveyAnswer column values
+    :return:
+    """
+    with get_engine().begin() as connection:
+        connection.execute(insert(SurveyAnswer), rows)
+
+
+RESULT_BAND_FIELDS = tuple(field + '_result' for field in RESULT_FIELDS)
+
+
+def _get_result_stats_keys(user: 'Results') -> List[Tuple[str, str, str, str]]:
+    """result_stats rows counting the user
+
+    :param user: Results row
+    :return: (student_class, age_category, field, band) keys, none for an unfinished survey
+    """
+    if user.total_risk_result is None:
+        return []
+    return [
+        (user.student_class or '', user.age_category or '', field, getattr(user, field))
+        for field in RESULT_BAND_FIELDS
+    ]
+
+
+def update_result_stats(session: SessionType, removed: List[tuple], added: List[tuple]):
+    """Changing result_stats counters with one upsert statement
+
+    Keys are written in sorted order, so concurrent transactions lock the
+    counter rows in the same order.
+
+    :param session: session of the transaction
+    :param removed: keys to decrement
+    :param added: keys to increment
+    :return:
+    """
+    deltas = Counter(added)
+    deltas.subtract(removed)
+    rows = [
+        {'student_class': student_class, 'age_category': age_category, 'field': field, 'band': band,
+         'respondents': delta}
+        for (student_class, age_category, field, band), delta in sorted(deltas.items()) if delta
+    ]
+    if not rows:
+        return
+
+    from sqlalchemy.dialects import postgresql, sqlite
+
+    dialect_insert = sqlite.insert if session.get_bind().dialect.name == 'sqlite' else postgresql.insert
+    statement = dialect_insert(ResultStats).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=['student_class', 'age_category', 'field', 'band'],
+        set_={'respondents': ResultStats.respondents + statement.excluded.respondents}
+    )
+    session.execute(statement)
+
+
+def rebuild_result_stats(connection):
+    """Recounting result_stats from the results table
+
+    On PostgreSQL the table is locked until the transaction ends, surveys
+    finished meanwhile wait with their counter updates and apply them on top
+    of the recounted values.
+
+    :param connection: connection of the transaction
+    :return:
+    """
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('LOCK TABLE result_stats IN EXCLUSIVE MODE'))
+    connection.execute(delete(ResultStats))
+    for field in RESULT_BAND_FIELDS:
+        band = getattr(Results, field)
+        student_class = func.coalesce(Results.student_class, '')
+        age_category = func.coalesce(Results.age_category, '')
+        connection.execute(insert(ResultStats).from_select(
+            ['student_class', 'age_category', 'field', 'band', 'respondents'],
+            select(student_class, age_category, literal(field), band, func.count())
+            .where(Results.total_risk_result.isnot(None))
+            .group_by(student_class, age_category, band)
+        ))
+
+
+def get_result_stats(student_class: Optional[str] = None, age_category: Optional[str] = None) -> List[tuple]:
+    """Reading result band counters
+
+    :param student_class: only this class
+    :param age_category: only this age category
+    :return: (student_class, age_category, field, band, respondents) rows ordered by class and age category
+    """
+    query = (
+        select(ResultStats.student_class, ResultStats.age_category, ResultStats.field, ResultStats.band,
+               ResultStats.respondents)
+        .where(ResultStats.respondents > 0)
+        .order_by(ResultStats.student_class, ResultStats.age_category)
+    )
+    if student_class:
+        query = query.where(ResultStats.student_class == student_class)
+    if age_category:
+        query = query.where(ResultStats.age_category == age_category)
+
+    with session_scope() as session:
+        return [tuple(row) for row in session.execute(query)]
+
+
 class User:
     def __init__(self, user_id: Union[int, str]):
-        self.user_id = user_id
+        self.user_id = int(user_id)
 
     def add_user(self, username: str):
         """Adding a user to the database
@@ -32,8 +259,7 @@ class User:
         :type username: str
         """
         try:
-            session = Session()
-            with session:
+            with session_scope() as session:
                 new_user = Results(
                     user_id=self.user_id, username=username
                 )
@@ -42,17 +268,55 @@ class User:
         except Exception as ex:
             logger.error(ex)
 
-    def add_user_info(self, student: Student):
+    def exists(self) -> bool:
+        """Check if the user is registered
+
+        :return: True if the user is in the database
+        """
+        with session_scope() as session:
+            return session.get(Results, self.user_id) is not None
+
+    def get_unfinished_survey(self) -> Optional[Tuple[Optional[str], List[Tuple[str, int, int]]]]:
+        """Getting the logged answers of a survey whose results are not saved
+
+        :return: age category and (bank, question number, points) of the logged answers
+            in answer order, None if the user is not registered or the results are saved
+        """
+        with session_scope() as session:
+            user = session.get(Results, self.user_id)
+            if user is None or user.total_risk_result is not None:
+                return None
+
+            answers = session.execute(
+                select(SurveyAnswer.bank, SurveyAnswer.question_number, SurveyAnswer.points)
+                .where(SurveyAnswer.user_id == self.user_id)
+                .order_by(SurveyAnswer.answer_id)
+            )
+            return user.age_category, [tuple(answer) for answer in answers]
+
+    def set_age_category(self, age_category: str):
+        """Saving the user's age category
+
+        :param age_category: '14-15 лет' / '16-18 лет'
+        :return:
+        """
+        try:
+            with session_scope() as session:
+                user = session.get(Results, self.user_id)
+                user.age_category = age_category
+                session.commit()
+        except Exception as ex:
+            logger.error(ex)
+
+    def add_user_info(self, student: 'Student'):
         """Adding general student information
 
         :param student: Student object
         :return:
         """
         try:
-            session = Session()
-
-            with session:
-                user = session.query(Results).filter_by(user_id=self.user_id).first()
+            with session_scope() as session:
+                user = session.get(Results, self.user_id)
 
                 user.first_name = student.student_name
                 user.last_name = student.student_last_name
@@ -70,9 +334,8 @@ class User:
         :return:
         """
         try:
-            session = Session()
-            with session:
-                user = session.query(Results).filter_by(user_id=self.user_id).first()
+            with session_scope() as session:
+                user = session.get(Results, self.user_id)
                 new_factor = getattr(user, factor) + int(value)
                 setattr(user, factor, new_factor)
                 session.commit()
@@ -82,82 +345,49 @@ class User:
     def set_results(self):
         """Calculate and update result values for a user."""
         try:
-            session = Session()
-            with session:
-                user = session.query(Results).filter_by(user_id=self.user_id).first()
-
-                user.total_risk = (
-                        user.family_factor +
-                        user.psychological_factor +
-                        user.env_factor +
-                        user.school_factor
-                )
+            with session_scope() as session:
+                user = session.get(Results, self.user_id)
+                self._calculate_results(session, user)
 
-                if user.age_category == '14-15 лет':
-                    factors = {
-                        'family_factor': {
-                            (0, 15): 'Низкая',
-                            (16, 26): 'Средняя',
-                            (27, 100): 'Высокая',
-                        },
-                        'psychological_factor': {
-                            (0, 20): 'Низкая',
-                            (21, 37): 'Средняя',
-                            (38, 100): 'Высокая',
-                        },
-                        'env_factor': {
-                            (0, 24): 'Низкая',
-                            (25, 41): 'Средняя',
-                            (42, 100): 'Высокая',
-                        },
-                        'school_factor': {
-                            (0, 9): 'Низкая',
-                            (10, 14): 'Средняя',
-                            (15, 100): 'Высокая',
-                        },
-                        'total_risk': {
-                            (0, 68): 'Низкая',
-                            (69, 118): 'Средняя',
-                            (119, 200): 'Высокая',
-                        },
-                    }
-                else:
-                    factors = {
-                        'family_factor': {
-                            (0, 17): 'Низкая',
-                            (18, 33): 'Средняя',
-                            (34, 100): 'Высокая',
-                        },
-                        'psychological_factor': {
-                            (0, 16): 'Низкая',
-                            (17, 37): 'Средняя',
-                            (38, 100): 'Высокая',
-                        },
-                        'env_factor': {
-                            (0, 22): 'Низкая',
-                            (23, 42): 'Средняя',
-                            (43, 100): 'Высокая',
-                        },
-                        'school_factor': {
-                            (0, 10): 'Низкая',
-                            (11, 16): 'Средняя',
-                            (17, 100): 'Высокая',
-                        },
-                        'total_risk': {
-                            (0, 65): 'Низкая',
-                            (66, 128): 'Средняя',
-                            (129, 200): 'Высокая',
-                        },
-                    }
-                for factor, results in factors.items():
-                    for (low, high), result in results.items():
-                        if low <= getattr(user, factor) <= high:
-                            setattr(user, factor + '_result', result)
-                            break
+                session.commit()
+        except Exception as ex:
+            logger.error(ex)
+
+    def save_results(self, scores: Dict[str, int]) -> bool:
+        """Save the factor totals of a finished survey and calculate the results in one transaction
+
+        :param scores: factor name -> accumulated points
+        :return: True if the results were saved
+        """
+        try:
+            with session_scope() as session:
+                user = session.get(Results, self.user_id)
+                for factor in FACTORS:
+                    setattr(user, factor, int(scores.get(factor, 0)))
+                self._calculate_results(session, user)
 
                 session.commit()
+                return True
         except Exception as ex:
             logger.error(ex)
+            return False
+
+    @staticmethod
+    def _calculate_results(session: SessionType, user: 'Results'):
+        """Calculate total risk and result values from the factor totals
+
+        The result_stats counters are moved from the previous result bands
+        of the user to the new ones in the same transaction.
+
+        :param session: session of the transaction
+        :param user: Results row
+        :return:
+        """
+        previous_keys = _get_result_stats_keys(user)
+        results = score(user.age_category, {factor: getattr(user, factor) for factor in FACTORS})
+        for field, value in results.items():
+            setattr(user, field, value)
+        update_result_stats(session, removed=previous_keys, added=_get_result_stats_keys(user))
 
     def add_bug_report(self, description: str):
         """Add a bug report to the database.
@@ -166,8 +396,7 @@ class User:
         :type description: str
         """
         try:
-            session = Session()
-            with session:
+            with session_scope() as session:
                 bug_report = BugReport(
                     user_id=self.user_id,
                     description=description
@@ -184,8 +413,7 @@ class User:
         :type status: str
         """
         try:
-            session = Session()
-            with session:
+            with session_scope() as session:
                 bug_report = session.query(BugReport).filter_by(user_id=self.user_id).first()
 
                 if bug_report:
@@ -224,17 +452,44 @@ class Results(Base):
 
     bug_reports = relationship('BugReport', back_populates='user', cascade='all, delete-orphan')
 
+    __table_args__ = (
+        # Exports and statistics filter by class and age category
+        Index('ix_results_student_class_age_category', 'student_class', 'age_category'),
+    )
+
 
 class BugReport(Base):
     __tablename__ = 'bug_reports'
 
     report_id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('results.user_id'))
-    report_status = Column(String, nullable=False, default='Open')
+    user_id = Column(Integer, ForeignKey('results.user_id'), index=True)
+    report_status = Column(String, nullable=False, default='Open', index=True)
     description = Column(String, nullable=False)
 
     # Define a relationship between BugReports and Results tables
     user = relationship('Results', back_populates='bug_reports')
 
 
-Base.metadata.create_all(engine)
+class SurveyAnswer(Base):
+    __tablename__ = 'answers'
+
+    answer_id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('results.user_id'), nullable=False, index=True)
+    # Question bank: 'low' / 'high'
+    bank = Column(String, nullable=False)
+    question_number = Column(SmallInteger, nullable=False)
+    answer_index = Column(SmallInteger, nullable=False)
+    points = Column(SmallInteger, nullable=False)
+    answered_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class ResultStats(Base):
+    __tablename__ = 'result_stats'
+
+    student_class = Column(String, primary_key=True)
+    age_category = Column(String, primary_key=True)
+    # family_factor_result / ... / total_risk_result
+    field = Column(String, primary_key=True)
+    band = Column(String, primary_key=True)
+    respondents = Column(Integer, nullable=False, default=0)
+
@@ -0,0 +1,180 @@
+"""Streaming export of the results table
+
+Rows are read through a server-side cursor in chunks of ``chunk_size``, so
+an export of any size holds only one chunk in memory. All functions are
+blocking and are called in a worker thread.
+"""
+import codecs
+import csv
+import io
+import tempfile
+from typing import BinaryIO, Iterable, Iterator, Optional, Sequence
+
+from sqlalchemy import Select, select
+
+from bot_app.scoring import AGE_CATEGORY_HIGH, AGE_CATEGORY_LOW
+from db.db_engine import Results, get_engine
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+EXPORT_COLUMNS = tuple(column.name for column in Results.__table__.columns)
+
+MEDIA_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Spellings of the age categories accepted in filters
+AGE_CATEGORY_ALIASES = {
+    'low': AGE_CATEGORY_LOW,
+    '14-15': AGE_CATEGORY_LOW,
+    AGE_CATEGORY_LOW: AGE_CATEGORY_LOW,
+    'high': AGE_CATEGORY_HIGH,
+    '16-18': AGE_CATEGORY_HIGH,
+    AGE_CATEGORY_HIGH: AGE_CATEGORY_HIGH,
+}
+
+
+def normalize_age_category(age_category: Optional[str]) -> Optional[str]:
+    """Getting the stored age category from a filter value
+
+    :param age_category: 'low' / 'high', '14-15' / '16-18' or the stored value
+    :return: stored age category or None for no filter
+    :raises ValueError: unknown age category
+    """
+    if not age_category:
+        return None
+    try:
+        return AGE_CATEGORY_ALIASES[age_category.strip()]
+    except KeyError:
+        raise ValueError(f'Unknown age category: {age_category}') from None
+
+
+def results_query(student_class: Optional[str] = None, age_category: Optional[str] = None) -> Select:
+    """Query of the exported rows
+
+    :param student_class: export only this class
+    :param age_category: export only this age category, see normalize_age_category
+    :return: select of EXPORT_COLUMNS
+    """
+    query = select(*Results.__table__.columns).order_by(Results.student_class, Results.last_name, Results.user_id)
+    if student_class:
+        query = query.where(Results.student_class == student_class)
+    age_category = normalize_age_category(age_category)
+    if age_category:
+        query = query.where(Results.age_category == age_category)
+    return query
+
+
+def iter_results(student_class: Optional[str] = None, age_category: Optional[str] = None,
+                 chunk_size: int = 1000) -> Iterator[Sequence]:
+    """Streaming rows of the results table
+
+    :param student_class: export only this class
+    :param age_category: export only this age category, see normalize_age_category
+    :param chunk_size: rows fetched from the server at once
+    :return: rows with EXPORT_COLUMNS values
+    """
+    query = results_query(student_class, age_category)
+    with get_engine().connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+        for chunk in result.partitions():
+            yield from chunk
+
+
+def _safe_cell(value):
+    # Values entered by students must not be treated as spreadsheet formulas
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@'):
+        return "'" + value
+    return value
+
+
+def iter_csv(rows: Iterable[Sequence], chunk_rows: int = 1000) -> Iterator[bytes]:
+    """Encoding rows as CSV
+
+    The output starts with a UTF-8 BOM, so Excel opens cyrillic text correctly.
+
+    :param rows: rows with EXPORT_COLUMNS values
+    :param chunk_rows: rows per yielded chunk
+    :return: CSV chunks
+    """
+    yield codecs.BOM_UTF8
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    pending = 0
+    for row in rows:
+        writer.writerow([_safe_cell(value) for value in row])
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def write_xlsx(rows: Iterable[Sequence], file: BinaryIO):
+    """Writing rows to an XLSX workbook
+
+    The workbook is created in write-only mode, which keeps the written rows
+    in a temporary file instead of memory.
+
+    :param rows: rows with EXPORT_COLUMNS values
+    :param file: binary file the workbook is saved to
+    :return:
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('results')
+    sheet.append(EXPORT_COLUMNS)
+    for row in rows:
+        sheet.append([_safe_cell(value) for value in row])
+    workbook.save(file)
+
+
+def export_results(file: BinaryIO, export_format: str = 'csv', student_class: Optional[str] = None,
+                   age_category: Optional[str] = None):
+    """Writing filtered results to a file
+
+    :param file: binary file
+    :param export_format: 'csv' or 'xlsx'
+    :param student_class: export only this class
+    :param age_category: export only this age category
+    :return:
+    """
+    rows = iter_results(student_class=student_class, age_category=age_category)
+    if export_format == 'xlsx':
+        write_xlsx(rows, file)
+    else:
+        for chunk in iter_csv(rows):
+            file.write(chunk)
+
+
+def iter_export(export_format: str = 'csv', student_class: Optional[str] = None, age_category: Optional[str] = None,
+                chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Export chunks for a streaming HTTP response
+
+    CSV is produced while the rows are read. An XLSX archive can only be sent
+    once it is complete, so it is written to a temporary file first.
+
+    :param export_format: 'csv' or 'xlsx'
+    :param student_class: export only this class
+    :param age_category: export only this age category
+    :param chunk_size: bytes per chunk of the XLSX file
+    :return: file chunks
+    """
+    if export_format != 'xlsx':
+        yield from iter_csv(iter_results(student_class=student_class, age_category=age_category))
+        return
+
+    with tempfile.TemporaryFile() as file:
+        export_results(file, 'xlsx', student_class=student_class, age_category=age_category)
+        file.seek(0)
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
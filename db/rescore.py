@@ -0,0 +1,109 @@
+"""Recalculating total_risk and result bands of all finished surveys
+
+Run after the thresholds in bot_app.scoring have changed:
+
+    python -m db.rescore --chunk-size 5000
+"""
+import argparse
+import time
+
+from sqlalchemy import bindparam, create_engine, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+
+from bot_app.scoring import score_batch
+from db.db_engine import Results, get_engine, logger, rebuild_result_stats
+
+RESULT_COLUMNS = (
+    'total_risk',
+    'family_factor_result',
+    'psychological_factor_result',
+    'env_factor_result',
+    'school_factor_result',
+    'total_risk_result',
+)
+
+UPDATE_RESULTS = (
+    update(Results.__table__)
+    .where(Results.__table__.c.user_id == bindparam('b_user_id'))
+    .values({column: bindparam(f'b_{column}') for column in RESULT_COLUMNS})
+)
+
+
+def create_writer_engine(engine: Engine, page_size: int) -> Engine:
+    """Engine sending executemany UPDATE statements in batches
+
+    psycopg2 batches only INSERT by default and sends an UPDATE per row.
+
+    :param engine: application engine
+    :param page_size: rows per round trip
+    :return: engine for the writes
+    """
+    if engine.dialect.name != 'postgresql':
+        return engine
+    return create_engine(engine.url, poolclass=NullPool, executemany_mode='values_plus_batch',
+                         executemany_batch_page_size=page_size)
+
+
+def rescore(chunk_size: int = 5000, page_size: int = 1000) -> int:
+    """Stream finished results and update them chunk by chunk
+
+    Rows are read through a server-side cursor on one connection and every
+    chunk is written with an executemany UPDATE on another one, sent to
+    PostgreSQL in pages of ``page_size`` rows. The result_stats table is
+    recounted afterwards.
+
+    :param chunk_size: rows per chunk
+    :param page_size: rows per round trip of the UPDATE
+    :return: number of updated rows
+    """
+    query = (
+        select(
+            Results.user_id,
+            Results.age_category,
+            Results.family_factor,
+            Results.psychological_factor,
+            Results.env_factor,
+            Results.school_factor,
+        )
+        .where(Results.total_risk_result.isnot(None))
+        .order_by(Results.user_id)
+    )
+
+    rows_count = 0
+    started = time.perf_counter()
+    engine = get_engine()
+    writer_engine = create_writer_engine(engine, page_size)
+    with engine.connect() as reader, writer_engine.connect() as writer:
+        result = reader.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+        for chunk in result.partitions():
+            scored = score_batch([row[1:] for row in chunk])
+            params = [
+                {'b_user_id': row.user_id, **{f'b_{column}': value for column, value in zip(RESULT_COLUMNS, values)}}
+                for row, values in zip(chunk, scored)
+            ]
+            writer.execute(UPDATE_RESULTS, params)
+            writer.commit()
+
+            rows_count += len(params)
+            elapsed = time.perf_counter() - started
+            logger.info(f'Rescored {rows_count} rows, {rows_count / elapsed:.0f} rows/s')
+
+        # The bands have changed, recount the per-class statistics
+        rebuild_result_stats(writer)
+        writer.commit()
+    if writer_engine is not engine:
+        writer_engine.dispose()
+
+    elapsed = time.perf_counter() - started
+    print(f'Rescored {rows_count} rows in {elapsed:.2f} s ({rows_count / elapsed if elapsed else 0:.0f} rows/s)')
+    return rows_count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recalculate survey results with the current thresholds')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='rows per UPDATE batch')
+    parser.add_argument('--page-size', type=int, default=1000, help='rows per round trip to PostgreSQL')
+    args = parser.parse_args()
+
+    rescore(chunk_size=args.chunk_size, page_size=args.page_size)
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from aiogram import Bot
+from aiogram.bot import api
+from aiogram.utils.exceptions import RetryAfter
+
+from dispatching.update_queue import release_lane
+from monitoring.metrics import BOT_API_ERRORS, BOT_API_LATENCY
+from monitoring.tracing import span
+
+logger = logging.getLogger('aiogram')
+
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', 30))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', 1))
+OUTBOUND_CHAT_BURST = int(os.getenv('OUTBOUND_CHAT_BURST', 3))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', 3))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# Methods which are counted against the Telegram message limits
+LIMITED_METHODS = frozenset({
+    api.Methods.SEND_MESSAGE,
+    api.Methods.COPY_MESSAGE,
+    api.Methods.FORWARD_MESSAGE,
+    api.Methods.EDIT_MESSAGE_TEXT,
+    api.Methods.EDIT_MESSAGE_REPLY_MARKUP,
+    api.Methods.SEND_PHOTO,
+    api.Methods.SEND_DOCUMENT,
+})
+
+outbound_priority: ContextVar[int] = ContextVar('outbound_priority', default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def background_priority() -> Iterator[None]:
+    """Sending the calls made inside the block after interactive replies
+
+    :return:
+    """
+    token = outbound_priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        outbound_priority.reset(token)
+
+
+class TokenBucket:
+    """Token bucket refilled with ``rate`` tokens per second up to ``capacity``"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available
+
+        :return:
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class OutboundScheduler:
+    """Paces outbound calls by global and per-chat token buckets
+
+    Background calls wait while interactive calls are waiting for the
+    global limit. A call waiting for its chat's limit releases the update
+    lane, so the other chats of the lane are not held up.
+    """
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE, chat_rate: float = OUTBOUND_CHAT_RATE,
+                 chat_burst: int = OUTBOUND_CHAT_BURST, max_chats: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chats = max_chats
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.waiting = {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 0}
+        # Interactive calls waiting for the global bucket
+        self.global_waiting = 0
+        self.sent = 0
+        self.delayed = 0
+        self.retried = 0
+
+    def _get_chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.max_chats:
+                self.chat_buckets.clear()
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def acquire(self, chat_id: Optional[int], priority: int = PRIORITY_INTERACTIVE):
+        """Waiting for a free slot to call the Bot API
+
+        :param chat_id: target chat id
+        :param priority: PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND
+        :return:
+        """
+        chat_bucket = self._get_chat_bucket(chat_id) if chat_id is not None else None
+        self.waiting[priority] += 1
+        blocked_on_global = False
+        delayed = False
+        try:
+            while True:
+                global_wait = self.global_bucket.wait_time()
+                chat_wait = chat_bucket.wait_time() if chat_bucket is not None else 0
+                if priority == PRIORITY_BACKGROUND and self.global_waiting:
+                    # Interactive calls are waiting for the global limit, let them go first
+                    global_wait = max(global_wait, 1 / self.global_bucket.rate)
+
+                wait = max(global_wait, chat_wait)
+                if wait <= 0:
+                    self.global_bucket.consume()
+                    if chat_bucket is not None:
+                        chat_bucket.consume()
+                    self.sent += 1
+                    return
+
+                if priority == PRIORITY_INTERACTIVE and blocked_on_global != (global_wait >= chat_wait):
+                    blocked_on_global = not blocked_on_global
+                    self.global_waiting += 1 if blocked_on_global else -1
+                if chat_wait > global_wait:
+                    release_lane()
+                if not delayed:
+                    delayed = True
+                    self.delayed += 1
+                await asyncio.sleep(wait)
+        finally:
+            if blocked_on_global:
+                self.global_waiting -= 1
+            self.waiting[priority] -= 1
+
+    def stats(self) -> dict:
+        """Queue depth and counters
+
+        :return:
+        """
+        return {
+            'waiting_interactive': self.waiting[PRIORITY_INTERACTIVE],
+            'waiting_background': self.waiting[PRIORITY_BACKGROUND],
+            'sent': self.sent,
+            'delayed': self.delayed,
+            'retried': self.retried,
+            'chats': len(self.chat_buckets),
+        }
+
+
+class RateLimitedBot(Bot):
+    """Bot which paces message sending and retries flood-wait errors
+
+    Telegram allows about 30 messages per second overall and about one
+    message per second to a chat. Calls of ``LIMITED_METHODS`` wait for the
+    ``OutboundScheduler`` and are retried after ``RetryAfter`` with jitter.
+    """
+
+    def __init__(self, *args, scheduler: Optional[OutboundScheduler] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler or OutboundScheduler()
+
+    async def _timed_request(self, method, data=None, files=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            with span('http', method):
+                return await super().request(method, data, files, **kwargs)
+        except Exception as ex:
+            BOT_API_ERRORS.labels(method, type(ex).__name__).inc()
+            raise
+        finally:
+            BOT_API_LATENCY.labels(method).observe(time.perf_counter() - started)
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        if method not in LIMITED_METHODS:
+            return await self._timed_request(method, data, files, **kwargs)
+
+        chat_id = data.get('chat_id') if data else None
+        try:
+            chat_id = int(chat_id) if chat_id is not None else None
+        except (TypeError, ValueError):
+            chat_id = None
+
+        priority = outbound_priority.get()
+        for attempt in range(OUTBOUND_MAX_RETRIES + 1):
+            await self.scheduler.acquire(chat_id, priority)
+            try:
+                return await self._timed_request(method, data, files, **kwargs)
+            except RetryAfter as ex:
+                if attempt == OUTBOUND_MAX_RETRIES:
+                    raise
+                self.scheduler.retried += 1
+                delay = ex.timeout + random.uniform(0, 1)
+                logger.warning(f'Flood control on {method} to {chat_id}, retry in {delay:.1f} s')
+                release_lane()
+                await asyncio.sleep(delay)
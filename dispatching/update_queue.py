@@ -0,0 +1,327 @@
+import asyncio
+import logging
+from collections import deque
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+import aiohttp
+from aiogram import Bot, Dispatcher, types
+from aiohttp.helpers import sentinel
+
+logger = logging.getLogger('aiogram')
+
+# Releases the lane of the update being processed, see release_lane
+_lane_release: ContextVar[Optional[Callable[[], None]]] = ContextVar('lane_release', default=None)
+
+
+def release_lane():
+    """Letting the lane of the current update go on with other chats
+
+    Called before a wait which concerns only the chat of the update, e.g. for
+    the chat's outbound rate limit. The later updates of the chat wait until
+    this one is processed, the other chats of the lane are not held up.
+
+    :return:
+    """
+    release = _lane_release.get()
+    if release is not None:
+        release()
+
+
+def get_chat_id(update: types.Update) -> Optional[int]:
+    """Getting the chat the update belongs to
+
+    :param update: Telegram update
+    :return: chat id or None for updates without a chat
+    """
+    if update.message:
+        return update.message.chat.id
+    if update.callback_query:
+        if update.callback_query.message:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    if update.edited_message:
+        return update.edited_message.chat.id
+    if update.my_chat_member:
+        return update.my_chat_member.chat.id
+    return None
+
+
+class ShardedUpdateQueue:
+    """Bounded queue that processes updates on N lanes
+
+    Updates are sharded by chat id, so updates of one chat are always
+    processed by the same lane strictly in the order they were received,
+    while different chats are processed concurrently.
+
+    An update which calls ``release_lane`` keeps being processed aside, the
+    lane goes on with the next update. Updates of the same chat are put in
+    the chat's backlog and processed after it, in order.
+    """
+
+    def __init__(self, process: Callable[[types.Update], Awaitable], lanes: int = 8, maxsize: int = 1000):
+        """
+        :param process: coroutine function processing one update
+        :param lanes: number of concurrently working lanes
+        :param maxsize: maximum number of waiting updates per lane
+        """
+        self.process = process
+        self.lanes: List[asyncio.Queue] = [asyncio.Queue(maxsize=maxsize) for _ in range(lanes)]
+        self.maxsize = maxsize
+        self.processed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.released = 0
+        self._workers: List[asyncio.Task] = []
+        # Chat key -> updates waiting for the chat's update being processed
+        self._backlogs: Dict[int, Deque[types.Update]] = {}
+        self._chat_tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _get_key(update: types.Update) -> int:
+        chat_id = get_chat_id(update)
+        return chat_id if chat_id is not None else update.update_id
+
+    def _get_lane(self, update: types.Update) -> asyncio.Queue:
+        return self.lanes[self._get_key(update) % len(self.lanes)]
+
+    def _track_depth(self, lane: asyncio.Queue):
+        if lane.qsize() > self.max_depth:
+            self.max_depth = lane.qsize()
+
+    def put_nowait(self, update: types.Update) -> bool:
+        """Enqueue the update without waiting
+
+        :param update: Telegram update
+        :return: False if the lane is full and the update was rejected
+        """
+        lane = self._get_lane(update)
+        try:
+            lane.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self._track_depth(lane)
+        return True
+
+    async def put(self, update: types.Update):
+        """Enqueue the update, waiting while the lane is full
+
+        :param update: Telegram update
+        :return:
+        """
+        lane = self._get_lane(update)
+        await lane.put(update)
+        self._track_depth(lane)
+
+    async def _worker(self, lane: asyncio.Queue):
+        while True:
+            update = await lane.get()
+            key = self._get_key(update)
+            backlog = self._backlogs.get(key)
+            if backlog is not None:
+                # An earlier update of the chat released the lane and is still processed
+                backlog.append(update)
+                continue
+
+            self._backlogs[key] = deque([update])
+            released = asyncio.Event()
+            task = asyncio.create_task(self._process_chat(lane, key, released))
+            self._chat_tasks.add(task)
+            task.add_done_callback(self._chat_tasks.discard)
+            await released.wait()
+
+    async def _process_chat(self, lane: asyncio.Queue, key: int, released: asyncio.Event):
+        """Processing the updates of a chat until its backlog is empty
+
+        :param lane: lane of the chat
+        :param key: chat key
+        :param released: set when the lane may go on with the next update
+        :return:
+        """
+        def release():
+            if not released.is_set():
+                self.released += 1
+                released.set()
+
+        _lane_release.set(release)
+        backlog = self._backlogs[key]
+        try:
+            while backlog:
+                update = backlog.popleft()
+                try:
+                    # A task per update gives it a fresh context: aiogram keeps
+                    # per-update values, e.g. the FSM state checked by StateFilter,
+                    # in context variables
+                    await asyncio.create_task(self.process(update))
+                    self.processed += 1
+                except Exception as ex:
+                    self.failed += 1
+                    logger.exception(ex)
+                finally:
+                    lane.task_done()
+        finally:
+            del self._backlogs[key]
+            released.set()
+
+    def start(self):
+        """Start the lane workers
+
+        :return:
+        """
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker(lane)) for lane in self.lanes]
+
+    async def stop(self, timeout: Optional[float] = 10):
+        """Process the remaining updates and stop the lane workers
+
+        :param timeout: seconds to wait for the queued updates
+        :return:
+        """
+        try:
+            await asyncio.wait_for(asyncio.gather(*(lane.join() for lane in self.lanes)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f'Update queue stopped with {self.depth()} unprocessed updates')
+
+        tasks = self._workers + list(self._chat_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+
+    def depth(self) -> int:
+        """Number of waiting updates
+
+        :return:
+        """
+        return sum(lane.qsize() for lane in self.lanes) + sum(len(backlog) for backlog in self._backlogs.values())
+
+    def stats(self) -> dict:
+        """Queue and backpressure counters
+
+        :return:
+        """
+        return {
+            'lanes': len(self.lanes),
+            'lane_maxsize': self.maxsize,
+            'depth': self.depth(),
+            'lane_depths': [lane.qsize() for lane in self.lanes],
+            'max_depth': self.max_depth,
+            'processed': self.processed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'released': self.released,
+        }
+
+
+class OrderedDispatcher(Dispatcher):
+    """Dispatcher which processes polled updates on per-chat ordered lanes
+
+    The default polling processes a batch of updates with ``asyncio.gather``,
+    so two fast taps of one user can be handled concurrently. After
+    ``start_lanes`` the updates are passed to a ``ShardedUpdateQueue`` instead.
+    The polling loop queues every batch itself before the next ``getUpdates``,
+    so polling pauses while a lane is full and updates of a chat stay in order
+    across batches.
+    """
+
+    update_queue: Optional[ShardedUpdateQueue] = None
+
+    def start_lanes(self, lanes: int = 8, maxsize: int = 1000):
+        """Start processing updates on lanes
+
+        :param lanes: number of concurrently working lanes
+        :param maxsize: maximum number of waiting updates per lane
+        :return:
+        """
+        self.update_queue = ShardedUpdateQueue(process=self._notify, lanes=lanes, maxsize=maxsize)
+        self.update_queue.start()
+
+    async def stop_lanes(self):
+        """Process the queued updates and stop the lanes
+
+        :return:
+        """
+        if self.update_queue is not None:
+            await self.update_queue.stop()
+            self.update_queue = None
+
+    async def _notify(self, update: types.Update):
+        Dispatcher.set_current(self)
+        Bot.set_current(self.bot)
+        await self.updates_handler.notify(update)
+
+    async def start_polling(self, timeout=20, relax=0.1, limit=None, reset_webhook=None, fast: bool = True,
+                            error_sleep: int = 5, allowed_updates: Optional[List[str]] = None):
+        """Long polling which waits until the received updates are queued
+
+        aiogram's polling spawns a task per batch and does not wait for it, so
+        full lanes would not slow it down. Without lanes the default polling
+        is used.
+
+        :param timeout: getUpdates long polling timeout
+        :param relax: pause between getUpdates calls
+        :param limit: maximum number of updates per batch
+        :param reset_webhook: delete the webhook before polling
+        :param fast: passed to process_updates
+        :param error_sleep: pause after a failed getUpdates call
+        :param allowed_updates: update types to receive
+        :return:
+        """
+        if self.update_queue is None:
+            return await super().start_polling(timeout=timeout, relax=relax, limit=limit,
+                                               reset_webhook=reset_webhook, fast=fast, error_sleep=error_sleep,
+                                               allowed_updates=allowed_updates)
+        if self._polling:
+            raise RuntimeError('Polling already started')
+
+        logger.info('Start polling on lanes.')
+        Dispatcher.set_current(self)
+        Bot.set_current(self.bot)
+
+        if reset_webhook is None:
+            await self.reset_webhook(check=False)
+        if reset_webhook:
+            await self.reset_webhook(check=True)
+
+        self._polling = True
+        offset = None
+        try:
+            current_request_timeout = self.bot.timeout
+            if current_request_timeout is not sentinel and timeout is not None:
+                request_timeout = aiohttp.ClientTimeout(total=current_request_timeout.total + timeout or 1)
+            else:
+                request_timeout = None
+
+            while self._polling:
+                try:
+                    with self.bot.request_timeout(request_timeout):
+                        updates = await self.bot.get_updates(limit=limit, offset=offset, timeout=timeout,
+                                                             allowed_updates=allowed_updates)
+                except asyncio.CancelledError:
+                    break
+                except Exception:
+                    logger.exception('Cause exception while getting updates.')
+                    await asyncio.sleep(error_sleep)
+                    continue
+
+                if updates:
+                    offset = updates[-1].update_id + 1
+                    # Waits while a lane is full
+                    await self.process_updates(updates, fast)
+
+                if relax:
+                    await asyncio.sleep(relax)
+        finally:
+            self._close_waiter.set_result(None)
+            logger.warning('Polling is stopped.')
+
+    async def process_updates(self, updates, fast: bool = True):
+        if self.update_queue is None:
+            return await super().process_updates(updates, fast)
+
+        for update in updates:
+            await self.update_queue.put(update)
+        return []
@@ -1,20 +1,174 @@
+import atexit
+import json
 import logging
+import os
+import queue
+import random
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Dict, List, Optional, Tuple
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_ROTATION = os.getenv('LOG_ROTATION', 'size')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_UPDATE_SAMPLE_RATE = float(os.getenv('LOG_UPDATE_SAMPLE_RATE', 1))
+
+# Logger of aiogram's LoggingMiddleware, which writes several lines per update
+UPDATE_LOGGER_NAME = 'aiogram.contrib.middlewares.logging'
+
+_file_handlers: Dict[str, QueueHandler] = {}
+_listeners: List[QueueListener] = []
+_configured = False
+
+# Update id and whether its LoggingMiddleware records are written, see sample_update_logs
+update_log_sampled: ContextVar[Optional[Tuple[int, bool]]] = ContextVar('update_log_sampled', default=None)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per log record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Passing INFO and lower records only of the sampled updates, warnings always pass"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        # Records outside an update are not sampled
+        decision = update_log_sampled.get()
+        return decision is None or decision[1]
+
+
+def sample_update_logs(update_id: int) -> bool:
+    """Deciding once per update whether its LoggingMiddleware records are written
+
+    The decision is kept in the context together with the update id, repeated
+    calls for the same update return it, so a sampled update is logged completely.
+
+    :param update_id: Telegram update id
+    :return: True if the update is logged
+    """
+    decision = update_log_sampled.get()
+    if decision is not None and decision[0] == update_id:
+        return decision[1]
+    sampled = LOG_UPDATE_SAMPLE_RATE >= 1 or random.random() < LOG_UPDATE_SAMPLE_RATE
+    update_log_sampled.set((update_id, sampled))
+    return sampled
+
+
+class ListenerQueueHandler(QueueHandler):
+    """Queue handler leaving the formatting to the listener thread
+
+    QueueHandler.prepare formats every record in the logging thread, here the
+    event loop. The queue is in-process and the records are not pickled, so
+    they are queued as they are and formatted by the listener's handlers.
+    Objects passed as log arguments must not be changed after logging.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _create_formatter() -> logging.Formatter:
+    if LOG_FORMAT == 'json':
+        return JsonFormatter()
+    return logging.Formatter('%(levelname)s - %(asctime)s - %(name)s - %(message)s')
+
+
+def _create_file_handler(log_file_name: str) -> logging.Handler:
+    if LOG_ROTATION == 'time':
+        handler = TimedRotatingFileHandler(log_file_name, when='midnight', backupCount=LOG_BACKUP_COUNT,
+                                           encoding='utf-8')
+    else:
+        handler = RotatingFileHandler(log_file_name, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                      encoding='utf-8')
+    handler.setFormatter(_create_formatter())
+    return handler
+
+
+def _create_queue_handler(*handlers: logging.Handler) -> QueueHandler:
+    """Moving the output of the handlers to a background thread
+
+    :param handlers: handlers writing the records
+    :return: handler putting the records into the queue
+    """
+    records_queue = queue.SimpleQueue()
+    listener = QueueListener(records_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return ListenerQueueHandler(records_queue)
+
+
+def stop_logging():
+    """Writing the queued records and stopping the listener threads
+
+    :return:
+    """
+    while _listeners:
+        _listeners.pop().stop()
+
+
+def configure_logging():
+    """Root logger setup, repeated calls do nothing
+
+    Records are formatted and written to stderr by a background thread, so
+    logging does not block the event loop. LoggingMiddleware records are
+    sampled per update with LOG_UPDATE_SAMPLE_RATE.
+
+    :return:
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(_create_queue_handler(console_handler))
+
+    if LOG_UPDATE_SAMPLE_RATE < 1:
+        logging.getLogger(UPDATE_LOGGER_NAME).addFilter(SamplingFilter())
+
+    atexit.register(stop_logging)
 
 
 def get_logger(logger_name: str, log_file_name: str):
     """Getting and writing logs to a file
 
+    The file handler of every file is created once and attached to a logger
+    once, however many times the function is called.
+
     :param logger_name: name of logger
     :param log_file_name: the name of the file to which the logs will be written
     :return:
     """
-    logging.basicConfig(level=logging.INFO,
-                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    configure_logging()
+
+    logger = logging.getLogger(logger_name)
+    logger.setLevel(LOG_LEVEL)
+
+    log_file_path = os.path.abspath(log_file_name)
+    queue_handler = _file_handlers.get(log_file_path)
+    if queue_handler is None:
+        queue_handler = _file_handlers[log_file_path] = _create_queue_handler(_create_file_handler(log_file_path))
 
-    aiogram_logger = logging.getLogger(logger_name)
-    aiogram_logger.setLevel(logging.INFO)
-    log_file_handler = logging.FileHandler(log_file_name)
-    log_file_handler.setFormatter(logging.Formatter('%(levelname)s - %(asctime)s - %(name)s - %(message)s'))
-    aiogram_logger.addHandler(log_file_handler)
+    if queue_handler not in logger.handlers:
+        logger.addHandler(queue_handler)
 
-    return aiogram_logger
+    return logger
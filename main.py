@@ -1,33 +1,51 @@
-import logging
+import asyncio
+import hmac
 import os
+from contextlib import asynccontextmanager
+from typing import Optional
 
-import uvicorn
 from aiogram import Bot, Dispatcher, types
-from aiogram.contrib.middlewares.logging import LoggingMiddleware
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.types import BotCommand
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, Query, Response
+from fastapi.responses import StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
-from bot_main import API_TOKEN, storage
+from bot_main import bot, dp, storage
+from bot_app.admin import admin_register_handlers
 from bot_app.bug_report import bug_report_register_handlers
 from bot_app.common import register_handlers_common
 from bot_app.registration import register_handlers_registration
+from db.answer_log import answer_log
+from db.async_db import shutdown_executor
+from db.cache import registered_users
+from db.db_engine import get_engine, get_pool_stats
+from db.export import EXPORT_FORMATS, MEDIA_TYPES, iter_export, normalize_age_category
+from dispatching.update_queue import ShardedUpdateQueue
 from logs.logger import get_logger
+from monitoring.metrics import (
+    ANSWER_LOG_PENDING, DB_POOL_CHECKED_OUT, FSM_STORAGE_SIZE, OUTBOUND_WAITING, UPDATE_QUEUE_DEPTH
+)
+from monitoring.tracing import profiler, recent_traces
 
 logger = get_logger(
     logger_name='aiogram',
     log_file_name='logs/ggl_bot.log'
 )
 
-bot = Bot(token=API_TOKEN)
-dp = Dispatcher(bot, storage=storage)
-logging.basicConfig(level=logging.INFO)
-dp.middleware.setup(LoggingMiddleware())
-
 HOST_URL = os.getenv('HOST_URL')
 WEBHOOK_PATH = f"/webhook"
 WEBHOOK_URL = HOST_URL + WEBHOOK_PATH
 
-app = FastAPI()
+WEBHOOK_FAST_ACK = os.getenv('WEBHOOK_FAST_ACK', '0') == '1'
+WEBHOOK_LANES = int(os.getenv('WEBHOOK_LANES', 8))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))
+
+APP_WORKERS = int(os.getenv('APP_WORKERS', 1))
+
+DEBUG_ENDPOINTS = os.getenv('DEBUG_ENDPOINTS', '0') == '1'
+EXPORT_TOKEN = os.getenv('EXPORT_TOKEN')
+MONITORING_TOKEN = os.getenv('MONITORING_TOKEN')
 
 
 async def set_commands(bot_: Bot):
@@ -43,6 +61,34 @@ async def set_commands(bot_: Bot):
     await bot_.set_my_commands(commands)
 
 
+def is_authorized(authorization: Optional[str], token: str) -> bool:
+    """Checking the ``Authorization: Bearer <token>`` header
+
+    :param authorization: Authorization header
+    :param token: expected token
+    :return: True if the header carries the token
+    """
+    return hmac.compare_digest(authorization or '', f'Bearer {token}')
+
+
+async def process_update(telegram_update: types.Update):
+    """Dispatching a Telegram update
+
+    :param telegram_update: Telegram update
+    :return:
+    """
+    Dispatcher.set_current(dp)
+    Bot.set_current(bot)
+    await dp.process_update(telegram_update)
+
+
+update_queue = ShardedUpdateQueue(
+    process=process_update,
+    lanes=WEBHOOK_LANES,
+    maxsize=WEBHOOK_QUEUE_SIZE
+)
+
+
 async def bot_main():
     """Applies all bot settings
 
@@ -53,11 +99,11 @@ async def bot_main():
     register_handlers_common(dp)
     register_handlers_registration(dp)
     bug_report_register_handlers(dp)
+    admin_register_handlers(dp)
 
     await set_commands(bot)
 
 
-@app.on_event("startup")
 async def on_startup():
     """Setting up a webhook
 
@@ -71,28 +117,68 @@ async def on_startup():
         )
 
 
-@app.post(WEBHOOK_PATH)
-async def bot_webhook(update: dict):
-    """Getting Telegram updates
+async def on_shutdown():
+    """Delete webhook and closing sessions
+
+    With several workers the webhook is kept, a stopping worker must not
+    cut off the updates of the others.
 
-    :param update: Telegram update
     :return:
     """
-    telegram_update = types.Update(**update)
-    Dispatcher.set_current(dp)
-    Bot.set_current(bot)
+    if APP_WORKERS == 1:
+        await bot.delete_webhook()
+    await bot.session.close()
+    await storage.close()
+    await storage.wait_closed()
+    shutdown_executor()
+
+
+@asynccontextmanager
+async def lifespan(app_: FastAPI):
+    """Bot initialization on application startup and cleanup on shutdown
+
+    Handlers and commands are set up here once, so processing an update
+    is only deserialization and dispatch. The database engine is created
+    here too, importing the application does not touch the database.
+
+    :param app_: FastAPI application
+    :return:
+    """
+    get_engine()
     await bot_main()
-    await dp.process_update(telegram_update)
+    await on_startup()
+    answer_log.start()
+    if WEBHOOK_FAST_ACK:
+        update_queue.start()
+    yield
+    if WEBHOOK_FAST_ACK:
+        await update_queue.stop()
+    await answer_log.stop()
+    await on_shutdown()
 
 
-@app.on_event("shutdown")
-async def on_shutdown():
-    """Closing session and delete webhook
+app = FastAPI(lifespan=lifespan)
+
 
+@app.post(WEBHOOK_PATH)
+async def bot_webhook(update: dict):
+    """Getting Telegram updates
+
+    With WEBHOOK_FAST_ACK=1 the update is only queued and Telegram gets
+    the response immediately. If the chat's lane is full, 503 is returned
+    and Telegram delivers the update again later.
+
+    :param update: Telegram update
     :return:
     """
-    await bot.session.close()
-    await bot.delete_webhook()
+    telegram_update = types.Update(**update)
+    if not WEBHOOK_FAST_ACK:
+        await process_update(telegram_update)
+        return
+
+    if not update_queue.put_nowait(telegram_update):
+        logger.warning(f'Update queue is full, update {telegram_update.update_id} rejected')
+        return Response(status_code=503)
 
 
 @app.get('/info')
@@ -104,11 +190,147 @@ async def home_page():
     return 'Bot running successfully!'
 
 
+if MONITORING_TOKEN:
+    @app.get('/metrics')
+    async def metrics(authorization: str = Header(None)):
+        """GET request to getting metrics in the Prometheus text format
+
+        Requires the ``Authorization: Bearer <MONITORING_TOKEN>`` header.
+
+        :param authorization: Authorization header
+        :return: metrics
+        """
+        if not is_authorized(authorization, MONITORING_TOKEN):
+            return Response(status_code=401)
+
+        UPDATE_QUEUE_DEPTH.set(update_queue.depth())
+        DB_POOL_CHECKED_OUT.set(get_pool_stats()['checked_out'])
+        ANSWER_LOG_PENDING.set(answer_log.pending())
+        scheduler_stats = bot.scheduler.stats()
+        OUTBOUND_WAITING.labels('interactive').set(scheduler_stats['waiting_interactive'])
+        OUTBOUND_WAITING.labels('background').set(scheduler_stats['waiting_background'])
+        FSM_STORAGE_SIZE.set(await storage.count_chats())
+
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+    @app.get('/info/queue')
+    async def queue_info(authorization: str = Header(None)):
+        """GET request to getting update queue statistics
+
+        :param authorization: Authorization header
+        :return: queue depth and counters
+        """
+        if not is_authorized(authorization, MONITORING_TOKEN):
+            return Response(status_code=401)
+        return update_queue.stats()
+
+
+    @app.get('/info/db')
+    async def db_info(authorization: str = Header(None)):
+        """GET request to getting database connection pool, answer log and user cache statistics
+
+        :param authorization: Authorization header
+        :return: pool size, connection, answer log and user cache counters
+        """
+        if not is_authorized(authorization, MONITORING_TOKEN):
+            return Response(status_code=401)
+        return {**get_pool_stats(), 'answer_log': answer_log.stats(), 'user_cache': registered_users.stats()}
+
+
+    @app.get('/info/bot')
+    async def bot_info(authorization: str = Header(None)):
+        """GET request to getting outbound Bot API scheduler statistics
+
+        :param authorization: Authorization header
+        :return: waiting calls and counters
+        """
+        if not is_authorized(authorization, MONITORING_TOKEN):
+            return Response(status_code=401)
+        return bot.scheduler.stats()
+
+
+if EXPORT_TOKEN:
+    @app.get('/export/results')
+    async def export_results(export_format: str = Query('csv', alias='format'), student_class: str = None, age_category: str = None,
+                             authorization: str = Header(None)):
+        """GET request to exporting survey results
+
+        The file is streamed while the rows are read from the database,
+        requires the ``Authorization: Bearer <EXPORT_TOKEN>`` header.
+
+        :param export_format: 'csv' or 'xlsx'
+        :param student_class: export only this class
+        :param age_category: export only this age category: low / high or 14-15 / 16-18
+        :param authorization: Authorization header
+        :return: results file
+        """
+        if not is_authorized(authorization, EXPORT_TOKEN):
+            return Response(status_code=401)
+        if export_format not in EXPORT_FORMATS:
+            return Response(f'Unknown format: {export_format}', status_code=400)
+        try:
+            normalize_age_category(age_category)
+        except ValueError as ex:
+            return Response(str(ex), status_code=400)
+
+        return StreamingResponse(
+            iter_export(export_format, student_class=student_class, age_category=age_category),
+            media_type=MEDIA_TYPES[export_format],
+            headers={'Content-Disposition': f'attachment; filename="results.{export_format}"'}
+        )
+
+
+if DEBUG_ENDPOINTS and MONITORING_TOKEN:
+    @app.get('/debug/traces')
+    async def debug_traces(authorization: str = Header(None)):
+        """GET request to getting the recently sampled update traces
+
+        :param authorization: Authorization header
+        :return: traces, the newest last
+        """
+        if not is_authorized(authorization, MONITORING_TOKEN):
+            return Response(status_code=401)
+        return list(recent_traces)
+
+
+    @app.post('/debug/profile')
+    async def debug_profile(seconds: float = 10, limit: int = 50, authorization: str = Header(None)):
+        """POST request to profiling the running process
+
+        Only the event loop thread is profiled, the database work in the run_sync
+        executor threads is not in the report.
+
+        :param seconds: profiling duration
+        :param limit: number of functions in the report
+        :param authorization: Authorization header
+        :return: cProfile report sorted by cumulative time
+        """
+        if not is_authorized(authorization, MONITORING_TOKEN):
+            return Response(status_code=401)
+        if profiler.running:
+            return Response('Profiler is already running', status_code=409)
+        profiler.start()
+        try:
+            await asyncio.sleep(min(seconds, 300))
+        finally:
+            report = profiler.stop(limit=limit)
+        return Response(report, media_type='text/plain')
+
+
 if __name__ == "__main__":
+    import uvicorn
+
     APP_HOST = os.getenv('APP_HOST')
     APP_PORT = int(os.getenv('APP_PORT'))
+    if APP_WORKERS > 1 and isinstance(storage, MemoryStorage):
+        logger.warning('MemoryStorage is not shared between workers, set FSM_STORAGE=redis')
+    if APP_WORKERS > 1:
+        logger.warning(f'Outbound limits and user caches are per worker, {APP_WORKERS} workers may send up to '
+                       f'{APP_WORKERS} times OUTBOUND_GLOBAL_RATE messages per second')
     uvicorn.run(
-        app,
+        'main:app',
         host=APP_HOST,
-        port=APP_PORT
+        port=APP_PORT,
+        workers=APP_WORKERS
     )
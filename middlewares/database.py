@@ -0,0 +1,41 @@
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from db.async_db import run_sync
+from db.db_engine import UnitOfWork, current_unit_of_work
+
+
+class DatabaseMiddleware(BaseMiddleware):
+    """Opens one unit of work per message or callback query
+
+    All database operations of the handler share its session and pooled
+    connection; the session is closed in the database thread pool after the
+    handler has finished. An update which did not use the database, e.g. a
+    survey answer with SURVEY_SAVE_MODE=final, does not go to the pool.
+    """
+
+    @staticmethod
+    def _open(data: dict):
+        data['_unit_of_work_token'] = current_unit_of_work.set(UnitOfWork())
+
+    @staticmethod
+    async def _close(data: dict):
+        token = data.pop('_unit_of_work_token', None)
+        if token is None:
+            return
+        unit_of_work = current_unit_of_work.get()
+        current_unit_of_work.reset(token)
+        if unit_of_work.opened:
+            await run_sync(unit_of_work.close)
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        self._open(data)
+
+    async def on_post_process_message(self, message: types.Message, results: list, data: dict):
+        await self._close(data)
+
+    async def on_pre_process_callback_query(self, callback_query: types.CallbackQuery, data: dict):
+        self._open(data)
+
+    async def on_post_process_callback_query(self, callback_query: types.CallbackQuery, results: list, data: dict):
+        await self._close(data)
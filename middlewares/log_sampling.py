@@ -0,0 +1,22 @@
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from logs.logger import sample_update_logs
+
+
+class LogSamplingMiddleware(BaseMiddleware):
+    """Samples the update log lines per update, not per line
+
+    Has to be installed before LoggingMiddleware. The webhook dispatches with
+    Dispatcher.process_update, which skips the update hooks, so the message and
+    callback query hooks take the decision as well.
+    """
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        sample_update_logs(update.update_id)
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        sample_update_logs(types.Update.get_current().update_id)
+
+    async def on_pre_process_callback_query(self, callback_query: types.CallbackQuery, data: dict):
+        sample_update_logs(types.Update.get_current().update_id)
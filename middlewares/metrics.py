@@ -0,0 +1,43 @@
+import time
+
+from aiogram import types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from monitoring.metrics import HANDLER_LATENCY, UPDATES
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Counts messages and callback queries and times their handlers"""
+
+    @staticmethod
+    def _start(data: dict):
+        handler = current_handler.get(None)
+        data['_metrics_handler'] = getattr(handler, '__name__', 'unknown')
+        data['_metrics_started'] = time.perf_counter()
+
+    @staticmethod
+    def _finish(data: dict):
+        started = data.pop('_metrics_started', None)
+        if started is None:
+            return
+        handler = data.pop('_metrics_handler')
+        HANDLER_LATENCY.labels(handler).observe(time.perf_counter() - started)
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        UPDATES.labels('message').inc()
+
+    async def on_pre_process_callback_query(self, callback_query: types.CallbackQuery, data: dict):
+        UPDATES.labels('callback_query').inc()
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        self._start(data)
+
+    async def on_process_callback_query(self, callback_query: types.CallbackQuery, data: dict):
+        self._start(data)
+
+    async def on_post_process_message(self, message: types.Message, results: list, data: dict):
+        self._finish(data)
+
+    async def on_post_process_callback_query(self, callback_query: types.CallbackQuery, results: list, data: dict):
+        self._finish(data)
@@ -1,54 +1,165 @@
-import asyncio
-from typing import Union
+import os
+import time
+from typing import Dict, Optional, Tuple, Union
 
-from aiogram import Dispatcher, types
-from aiogram.dispatcher import DEFAULT_RATE_LIMIT
-from aiogram.dispatcher.handler import CancelHandler, current_handler
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler
 from aiogram.dispatcher.middlewares import BaseMiddleware
-from aiogram.utils.exceptions import Throttled
+
+from bot_app.keyboard.answer_codec import decode_answer
+from monitoring.metrics import UPDATES_THROTTLED
+
+THROTTLE_RATE = float(os.getenv('THROTTLE_RATE', 3))
+THROTTLE_BURST = int(os.getenv('THROTTLE_BURST', 5))
+# Answer buttons of the survey questions, respondents tap them quickly
+THROTTLE_ANSWER_RATE = float(os.getenv('THROTTLE_ANSWER_RATE', 10))
+THROTTLE_ANSWER_BURST = int(os.getenv('THROTTLE_ANSWER_BURST', 20))
+
+
+class MemoryRateStore:
+    """Per-key GCRA state kept in process memory"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._tat: Dict[str, float] = {}
+
+    async def hit(self, key: str, interval: float, tolerance: float) -> Tuple[bool, float]:
+        """Registering an event of the key
+
+        :param key: rate limited key
+        :param interval: seconds between events at the sustained rate
+        :param tolerance: how far ahead of the sustained rate the key may run
+        :return: (allowed, seconds until the next event is allowed)
+        """
+        now = time.monotonic()
+        tat = max(self._tat.get(key, now), now)
+        if tat - now > tolerance:
+            return False, tat - tolerance - now
+
+        if len(self._tat) >= self.max_keys and key not in self._tat:
+            self._tat = {k: v for k, v in self._tat.items() if v > now}
+            if len(self._tat) >= self.max_keys:
+                self._tat.clear()
+        self._tat[key] = tat + interval
+        return True, 0.0
+
+
+class RedisRateStore:
+    """Per-key GCRA state shared by several processes through Redis"""
+
+    _SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local interval = tonumber(ARGV[2])
+    local tolerance = tonumber(ARGV[3])
+    local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+    if tat < now then tat = now end
+    if tat - now > tolerance then
+        return tostring(tat - tolerance - now)
+    end
+    redis.call('SET', KEYS[1], tostring(tat + interval), 'PX', math.ceil((tat + interval - now) * 1000) + 1)
+    return '0'
+    """
+
+    def __init__(self, redis, prefix: str = 'throttle'):
+        """
+        :param redis: redis.asyncio.Redis instance
+        :param prefix: key prefix
+        """
+        self.redis = redis
+        self.prefix = prefix
+        self._script = redis.register_script(self._SCRIPT)
+
+    async def hit(self, key: str, interval: float, tolerance: float) -> Tuple[bool, float]:
+        retry_after = float(await self._script(
+            keys=[f'{self.prefix}:{key}'],
+            args=[time.time(), interval, tolerance]
+        ))
+        return retry_after <= 0, retry_after
+
+
+def create_rate_store() -> Union[MemoryRateStore, RedisRateStore]:
+    """Create the rate store selected in the environment
+
+    THROTTLE_STORAGE=redis shares the counters between workers,
+    the Redis connection is configured by the same variables as the FSM storage.
+
+    :return: rate store
+    """
+    if os.getenv('THROTTLE_STORAGE', 'memory') == 'redis':
+        from redis.asyncio import Redis
+
+        return RedisRateStore(Redis(
+            host=os.getenv('REDIS_HOST', 'localhost'),
+            port=int(os.getenv('REDIS_PORT', 6379)),
+            db=int(os.getenv('REDIS_DB', 0)),
+            password=os.getenv('REDIS_PASSWORD') or None,
+        ))
+    return MemoryRateStore()
 
 
 class ThrottlingMiddleware(BaseMiddleware):
+    """Anti-flood middleware based on the generic cell rate algorithm
+
+    Every user may send ``limit`` events per second with bursts of up to
+    ``burst`` events. Taps on survey answer buttons have their own, higher
+    ``answer_limit`` and ``answer_burst``. An event over the limit is rejected
+    immediately, the user is warned once per blocked period.
 
-    def __init__(self, limit=DEFAULT_RATE_LIMIT, key_prefix='antiflood_'):
-        self.rate_limit = limit
+    The middleware has to be installed before the metrics and tracing
+    middlewares: a rejected event skips the post-processing of the
+    middlewares which have already seen it.
+    """
+
+    def __init__(self, limit: float = THROTTLE_RATE, burst: int = THROTTLE_BURST,
+                 store: Optional[Union[MemoryRateStore, RedisRateStore]] = None, key_prefix='antiflood',
+                 answer_limit: float = THROTTLE_ANSWER_RATE, answer_burst: int = THROTTLE_ANSWER_BURST):
+        self.interval = 1 / limit
+        self.tolerance = self.interval * (burst - 1)
+        self.answer_interval = 1 / answer_limit
+        self.answer_tolerance = self.answer_interval * (answer_burst - 1)
+        self.store = store or create_rate_store()
         self.prefix = key_prefix
+        self.rejected = 0
+        self._warned: Dict[int, float] = {}
         super(ThrottlingMiddleware, self).__init__()
 
     async def throttle(self, target: Union[types.Message, types.CallbackQuery]):
-        handler = current_handler.get()
-        dispatcher = Dispatcher.get_current()
-        if not handler:
+        user = target.from_user
+        if user is None:
             return
-        limit = getattr(handler, 'throttling_rate_limit', self.rate_limit)
-        key = getattr(handler, 'throttling_key', f"{self.prefix}_{handler.__name__}")
-
-        try:
-            await dispatcher.throttle(key, rate=limit)
-        except Throttled as t:
-            await self.target_throttled(target, t, dispatcher, key)
-            raise CancelHandler()
 
-    @staticmethod
-    async def target_throttled(target: Union[types.Message, types.CallbackQuery],
-                               throttled: Throttled, dispatcher: Dispatcher, key: str):
-        msg = target.message if isinstance(target, types.CallbackQuery) else target
-        delta = throttled.rate - throttled.delta
+        if isinstance(target, types.CallbackQuery) and decode_answer(target.data) is not None:
+            allowed, retry_after = await self.store.hit(f'{self.prefix}:answer:{user.id}', self.answer_interval,
+                                                        self.answer_tolerance)
+        else:
+            allowed, retry_after = await self.store.hit(f'{self.prefix}:{user.id}', self.interval, self.tolerance)
+        if allowed:
+            return
 
-        await asyncio.sleep(delta)
+        self.rejected += 1
+        UPDATES_THROTTLED.labels('callback_query' if isinstance(target, types.CallbackQuery) else 'message').inc()
+        await self.target_throttled(target, retry_after)
+        raise CancelHandler()
 
-        if throttled.exceeded_count == 2:
-            await msg.reply('Too many requests')
+    async def target_throttled(self, target: Union[types.Message, types.CallbackQuery], retry_after: float):
+        now = time.monotonic()
+        user_id = target.from_user.id
+        if self._warned.get(user_id, 0) > now:
+            if isinstance(target, types.CallbackQuery):
+                await target.answer()
             return
-        elif throttled.exceeded_count == 3:
-            await msg.reply(f'⚠ You are blocked on {round(delta, 3)} seconds')
-            return
-        thr = await dispatcher.check_key(key)
-        if thr.exceeded_count == throttled.exceeded_count:
-            await msg.reply("⚠ You are unblocked")
 
-    async def on_process_message(self, message, data):
+        if len(self._warned) > 10000:
+            self._warned = {k: v for k, v in self._warned.items() if v > now}
+        self._warned[user_id] = now + retry_after
+
+        if isinstance(target, types.CallbackQuery):
+            await target.answer('Слишком много запросов, подождите немного')
+        else:
+            await target.reply('Слишком много запросов, подождите немного')
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
         await self.throttle(message)
 
-    async def on_process_callback_query(self, call, data):
+    async def on_pre_process_callback_query(self, call: types.CallbackQuery, data: dict):
         await self.throttle(call)
@@ -0,0 +1,46 @@
+from aiogram import types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from monitoring.tracing import finish_trace, span, start_trace
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Traces a sample of messages and callback queries
+
+    Handler, database, Bot API and FSM storage spans of a traced update are
+    collected in ``monitoring.tracing.recent_traces``.
+    """
+
+    @staticmethod
+    def _start_handler(data: dict):
+        if '_trace_token' not in data or data['_trace_token'] is None:
+            return
+        handler = current_handler.get(None)
+        handler_span = span('handler', getattr(handler, '__name__', 'unknown'))
+        data['_trace_handler'] = handler_span.__enter__()
+
+    @staticmethod
+    def _finish(data: dict):
+        handler_span = data.pop('_trace_handler', None)
+        if handler_span is not None:
+            handler_span.__exit__(None, None, None)
+        finish_trace(data.pop('_trace_token', None))
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        data['_trace_token'] = start_trace('message')
+
+    async def on_pre_process_callback_query(self, callback_query: types.CallbackQuery, data: dict):
+        data['_trace_token'] = start_trace('callback_query')
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        self._start_handler(data)
+
+    async def on_process_callback_query(self, callback_query: types.CallbackQuery, data: dict):
+        self._start_handler(data)
+
+    async def on_post_process_message(self, message: types.Message, results: list, data: dict):
+        self._finish(data)
+
+    async def on_post_process_callback_query(self, callback_query: types.CallbackQuery, results: list, data: dict):
+        self._finish(data)
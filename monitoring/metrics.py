@@ -0,0 +1,63 @@
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+UPDATES = Counter(
+    'bot_updates_total', 'Processed messages and callback queries', ['type']
+)
+UPDATES_THROTTLED = Counter(
+    'bot_updates_throttled_total', 'Messages and callback queries rejected by the anti-flood limit', ['type']
+)
+HANDLER_LATENCY = Histogram(
+    'bot_handler_duration_seconds', 'Handler processing time', ['handler'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+)
+DB_QUERIES = Counter(
+    'db_queries_total', 'Executed SQL statements'
+)
+DB_QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'SQL statement execution time',
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1)
+)
+BOT_API_LATENCY = Histogram(
+    'bot_api_request_duration_seconds', 'Bot API request time', ['method'],
+    buckets=(.025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+)
+BOT_API_ERRORS = Counter(
+    'bot_api_errors_total', 'Failed Bot API requests', ['method', 'error']
+)
+FSM_STORAGE_SIZE = Gauge(
+    'fsm_storage_chats', 'Chats with an FSM state'
+)
+UPDATE_QUEUE_DEPTH = Gauge(
+    'bot_update_queue_depth', 'Updates waiting in the webhook queue'
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    'db_pool_checked_out', 'Database connections in use'
+)
+ANSWER_LOG_PENDING = Gauge(
+    'answer_log_pending', 'Answers waiting to be written to the answers table'
+)
+OUTBOUND_WAITING = Gauge(
+    'bot_outbound_waiting', 'Bot API calls waiting for the rate limiter', ['priority']
+)
+
+
+def instrument_engine(engine: Engine):
+    """Counting and timing SQL statements of the engine
+
+    :param engine: SQLAlchemy engine
+    :return:
+    """
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        DB_QUERIES.inc()
+        DB_QUERY_LATENCY.observe(time.perf_counter() - started)
@@ -0,0 +1,147 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, List, Optional
+
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0))
+TRACE_SLOW_THRESHOLD = float(os.getenv('TRACE_SLOW_THRESHOLD', 1))
+TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', 100))
+
+logger = logging.getLogger('tracing')
+
+
+class Trace:
+    """Spans recorded while one update was processed"""
+
+    __slots__ = ('name', 'started', 'duration', 'spans')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+        # (kind, name, offset from the trace start, duration)
+        self.spans: List[tuple] = []
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'duration_ms': round((self.duration or 0) * 1000, 3),
+            'spans': [
+                {'kind': kind, 'name': name, 'start_ms': round(start * 1000, 3), 'duration_ms': round(duration * 1000, 3)}
+                for kind, name, start, duration in self.spans
+            ],
+        }
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar('current_trace', default=None)
+recent_traces: Deque[dict] = deque(maxlen=TRACE_BUFFER_SIZE)
+
+
+class span:
+    """Recording a span of the given kind into the current trace
+
+    Does nothing if the update is not traced.
+
+    .. code-block:: python3
+
+        with span('db', 'edit_factor'):
+            ...
+    """
+
+    __slots__ = ('kind', 'name', 'trace', 'started')
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+
+    def __enter__(self):
+        self.trace = current_trace.get()
+        if self.trace is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.trace is not None:
+            now = time.perf_counter()
+            self.trace.spans.append((self.kind, self.name, self.started - self.trace.started, now - self.started))
+
+
+def start_trace(name: str):
+    """Starting a trace of the update if it is sampled
+
+    :param name: trace name
+    :return: context variable token or None if the update is not traced
+    """
+    if TRACE_SAMPLE_RATE <= 0 or random.random() >= TRACE_SAMPLE_RATE:
+        return None
+    return current_trace.set(Trace(name))
+
+
+def finish_trace(token):
+    """Finishing the trace started by start_trace
+
+    Finished traces are kept in ``recent_traces``, traces longer than
+    TRACE_SLOW_THRESHOLD seconds are also logged.
+
+    :param token: token returned by start_trace
+    :return:
+    """
+    if token is None:
+        return
+    trace = current_trace.get()
+    current_trace.reset(token)
+    if trace is None:
+        return
+
+    trace.duration = time.perf_counter() - trace.started
+    trace_data = trace.to_dict()
+    recent_traces.append(trace_data)
+    if trace.duration >= TRACE_SLOW_THRESHOLD:
+        logger.warning(json.dumps(trace_data, ensure_ascii=False))
+
+
+class Profiler:
+    """cProfile of the running process, started and stopped on demand
+
+    cProfile profiles only the thread it is enabled in, the event loop here. The
+    database calls run in the run_sync executor threads and are not in the report,
+    the loop only shows the awaiting; their time is in the SQL metrics and traces.
+    """
+
+    def __init__(self):
+        self._profile: Optional[cProfile.Profile] = None
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    def start(self):
+        if self._profile is not None:
+            return
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self, limit: int = 50, sort: str = 'cumulative') -> str:
+        """Stopping the profiler
+
+        :param limit: number of functions in the report
+        :param sort: pstats sort key
+        :return: profile report
+        """
+        if self._profile is None:
+            return ''
+        self._profile.disable()
+        stream = io.StringIO()
+        pstats.Stats(self._profile, stream=stream).sort_stats(sort).print_stats(limit)
+        self._profile = None
+        return stream.getvalue()
+
+
+profiler = Profiler()
@@ -0,0 +1,119 @@
+import json
+import os
+import typing
+
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.contrib.fsm_storage.redis import RedisStorage2, STATE_BUCKET_KEY, STATE_DATA_KEY, STATE_KEY
+from aiogram.dispatcher.storage import BaseStorage
+
+from monitoring.tracing import span
+
+
+def _dumps(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+class TracingStorageMixin:
+    """Records FSM storage calls as spans of the traced update"""
+
+    async def get_state(self, **kwargs):
+        with span('storage', 'get_state'):
+            return await super().get_state(**kwargs)
+
+    async def set_state(self, **kwargs):
+        with span('storage', 'set_state'):
+            return await super().set_state(**kwargs)
+
+    async def get_data(self, **kwargs):
+        with span('storage', 'get_data'):
+            return await super().get_data(**kwargs)
+
+    async def set_data(self, **kwargs):
+        with span('storage', 'set_data'):
+            return await super().set_data(**kwargs)
+
+    async def update_data(self, **kwargs):
+        with span('storage', 'update_data'):
+            return await super().update_data(**kwargs)
+
+
+class TracedMemoryStorage(TracingStorageMixin, MemoryStorage):
+
+    async def count_chats(self) -> int:
+        """Number of chats with an FSM state
+
+        :return:
+        """
+        return sum(1 for users in self.data.values() for user in users.values() if user.get('state'))
+
+
+class CompactRedisStorage(TracingStorageMixin, RedisStorage2):
+    """Redis FSM storage which writes state data as compact JSON
+
+    Survey data is rewritten on every answer, so separators without
+    whitespace and unescaped cyrillic noticeably shrink the stored values.
+    """
+
+    async def set_data(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        chat, user = self.check_address(chat=chat, user=user)
+        key = self.generate_key(chat, user, STATE_DATA_KEY)
+        if data:
+            await self._redis.set(key, _dumps(data), ex=self._data_ttl)
+        else:
+            await self._redis.delete(key)
+
+    async def count_chats(self) -> int:
+        """Number of chats with an FSM state
+
+        The state keys are counted with SCAN, which does not block Redis
+        but reads every key of the database.
+
+        :return:
+        """
+        count = 0
+        async for _ in self._redis.scan_iter(match=self.generate_key('*', '*', STATE_KEY), count=1000):
+            count += 1
+        return count
+
+    async def set_bucket(self, *, chat: typing.Union[str, int, None] = None, user: typing.Union[str, int, None] = None,
+                         bucket: typing.Dict = None):
+        chat, user = self.check_address(chat=chat, user=user)
+        key = self.generate_key(chat, user, STATE_BUCKET_KEY)
+        if bucket:
+            await self._redis.set(key, _dumps(bucket), ex=self._bucket_ttl)
+        else:
+            await self._redis.delete(key)
+
+
+def _get_ttl(name: str) -> typing.Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def create_storage(storage_type: typing.Optional[str] = None) -> BaseStorage:
+    """Create the FSM storage selected in the environment
+
+    Both storages count their chats for the ``fsm_storage_chats`` gauge.
+
+    :param storage_type: 'memory' or 'redis', FSM_STORAGE by default
+    :return: storage object
+    """
+    storage_type = storage_type or os.getenv('FSM_STORAGE', 'memory')
+    if storage_type == 'memory':
+        return TracedMemoryStorage()
+
+    if storage_type == 'redis':
+        return CompactRedisStorage(
+            host=os.getenv('REDIS_HOST', 'localhost'),
+            port=int(os.getenv('REDIS_PORT', 6379)),
+            db=int(os.getenv('REDIS_DB', 0)),
+            password=os.getenv('REDIS_PASSWORD') or None,
+            pool_size=int(os.getenv('REDIS_POOL_SIZE', 10)),
+            prefix=os.getenv('REDIS_PREFIX', 'fsm'),
+            state_ttl=_get_ttl('FSM_STATE_TTL'),
+            data_ttl=_get_ttl('FSM_DATA_TTL'),
+            bucket_ttl=_get_ttl('FSM_BUCKET_TTL'),
+        )
+
+    raise ValueError(f'Unknown FSM storage type: {storage_type}')
@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The application reads DATABASE_URL on import, tests never touch the configured database
+os.environ['DATABASE_URL'] = os.getenv('TEST_DATABASE_URL') or (
+    'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='ggl_bot_test_'), 'test.sqlite3')
+)
+# Token protected endpoints of the webhook app are registered only with a token
+os.environ['EXPORT_TOKEN'] = 'test-export-token'
+os.environ['MONITORING_TOKEN'] = 'test-monitoring-token'
+
+
+@pytest.fixture(scope='session')
+def migrated_engine():
+    """Engine of the test database with the schema created by the migrations"""
+    subprocess.run([sys.executable, '-m', 'alembic', 'upgrade', 'head'], cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    from sqlalchemy import text
+
+    from db.db_engine import get_engine
+
+    engine = get_engine()
+    if engine.dialect.name == 'sqlite':
+        # Jobs stream rows on one connection while writing on another, like on PostgreSQL
+        with engine.connect() as connection:
+            connection.execute(text('PRAGMA journal_mode=WAL'))
+    return engine
+
+
+@pytest.fixture
+def engine(migrated_engine):
+    """Engine of the test database, the tables are emptied after the test"""
+    yield migrated_engine
+
+    from db.db_engine import Base
+
+    with migrated_engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+
+class FakeBotAPI:
+    """Bot API calls of the bot recorded instead of being sent"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        data = dict(data or {})
+        self.calls.append((method, data))
+        if method in ('sendMessage', 'sendDocument'):
+            return {'message_id': len(self.calls), 'date': 0, 'text': data.get('text'),
+                    'chat': {'id': int(data['chat_id']), 'type': 'private'}}
+        return True
+
+    def sent(self, method: str) -> list:
+        return [data for called, data in self.calls if called == method]
+
+
+@pytest.fixture
+def bot_api(monkeypatch):
+    """Fake Bot API of bot_main.bot, set as the current bot"""
+    from aiogram import Bot
+
+    from bot_main import bot
+    from dispatching.rate_limiter import OutboundScheduler
+
+    api = FakeBotAPI()
+    monkeypatch.setattr(bot, '_timed_request', api.request)
+    monkeypatch.setattr(bot, 'scheduler', OutboundScheduler(global_rate=1000, chat_rate=1000, chat_burst=1000))
+    Bot.set_current(bot)
+    return api
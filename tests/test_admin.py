@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+from aiogram import Dispatcher, types
+from sqlalchemy import insert
+
+from bot_app.admin import FIELD_NAMES, admin_register_handlers, format_stats
+from bot_app.scoring import AGE_CATEGORY_HIGH, AGE_CATEGORY_LOW
+from bot_main import bot
+from db.db_engine import ResultStats
+
+ADMIN_ID = 500
+
+
+def make_command(user_id: int, text: str) -> types.Update:
+    return types.Update(**{
+        'update_id': 1,
+        'message': {
+            'message_id': 1, 'date': 0, 'text': text,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'test'},
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}],
+        },
+    })
+
+
+def seed_stats(engine):
+    rows = [
+        ('9А', AGE_CATEGORY_LOW, 'total_risk_result', 'Низкая', 3),
+        ('9А', AGE_CATEGORY_LOW, 'total_risk_result', 'Высокая', 1),
+        ('9А', AGE_CATEGORY_LOW, 'family_factor_result', 'Средняя', 4),
+        ('10<Б>', AGE_CATEGORY_HIGH, 'total_risk_result', 'Средняя', 2),
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(ResultStats), [
+            dict(zip(('student_class', 'age_category', 'field', 'band', 'respondents'), row)) for row in rows
+        ])
+
+
+@pytest.fixture
+def admin_dp(monkeypatch, bot_api):
+    monkeypatch.setenv('ADMIN_ID', str(ADMIN_ID))
+    dp = Dispatcher(bot)
+    admin_register_handlers(dp)
+    Dispatcher.set_current(dp)
+    return dp
+
+
+def test_stats_are_formatted_per_class_and_age_category():
+    rows = [
+        ('9А', AGE_CATEGORY_LOW, 'total_risk_result', 'Низкая', 3),
+        ('9А', AGE_CATEGORY_LOW, 'total_risk_result', 'Высокая', 1),
+        ('9А', AGE_CATEGORY_LOW, 'school_factor_result', 'Средняя', 4),
+        ('', None, 'total_risk_result', 'Средняя', 2),
+    ]
+
+    blocks = list(format_stats(rows))
+
+    assert blocks[0].splitlines() == [
+        f'<b>9А, {AGE_CATEGORY_LOW}</b>: 4',
+        f'{FIELD_NAMES["total_risk_result"]}: низкая 3, средняя 0, высокая 1',
+        f'{FIELD_NAMES["family_factor_result"]}: низкая 0, средняя 0, высокая 0',
+        f'{FIELD_NAMES["psychological_factor_result"]}: низкая 0, средняя 0, высокая 0',
+        f'{FIELD_NAMES["env_factor_result"]}: низкая 0, средняя 0, высокая 0',
+        f'{FIELD_NAMES["school_factor_result"]}: низкая 0, средняя 4, высокая 0',
+    ]
+    assert blocks[1].splitlines()[0] == '<b>Класс не указан, возраст не указан</b>: 2'
+
+
+def test_stats_command_reads_the_counters(engine, admin_dp, bot_api):
+    seed_stats(engine)
+
+    asyncio.run(admin_dp.process_update(make_command(ADMIN_ID, '/stats')))
+
+    [message] = bot_api.sent('sendMessage')
+    assert message['parse_mode'] == types.ParseMode.HTML
+    # The class name is escaped
+    assert f'<b>10&lt;Б&gt;, {AGE_CATEGORY_HIGH}</b>: 2' in message['text']
+    assert f'<b>9А, {AGE_CATEGORY_LOW}</b>: 4' in message['text']
+
+
+def test_stats_command_filters_by_class(engine, admin_dp, bot_api):
+    seed_stats(engine)
+
+    asyncio.run(admin_dp.process_update(make_command(ADMIN_ID, '/stats class=9А')))
+
+    [message] = bot_api.sent('sendMessage')
+    assert '9А' in message['text']
+    assert '10&lt;Б&gt;' not in message['text']
+
+
+def test_stats_command_without_finished_surveys(engine, admin_dp, bot_api):
+    asyncio.run(admin_dp.process_update(make_command(ADMIN_ID, '/stats')))
+
+    assert bot_api.sent('sendMessage')[0]['text'] == 'Нет завершенных опросов'
+
+
+def test_stats_command_rejects_unknown_arguments(engine, admin_dp, bot_api):
+    asyncio.run(admin_dp.process_update(make_command(ADMIN_ID, '/stats age=old')))
+
+    assert bot_api.sent('sendMessage')[0]['text'].startswith('Unknown age category: old')
+
+
+def test_stats_command_is_admin_only(engine, admin_dp, bot_api):
+    seed_stats(engine)
+
+    asyncio.run(admin_dp.process_update(make_command(ADMIN_ID + 1, '/stats')))
+
+    assert bot_api.calls == []
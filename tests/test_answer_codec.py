@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+from bot_app.keyboard.answer_codec import AnswerPayload, answer_filter, decode_answer, encode_answer
+from middlewares.throttling import MemoryRateStore
+from tests.test_throttling import SilentThrottlingMiddleware, count_allowed, make_callback_query
+
+
+@pytest.mark.parametrize('question_number, answer_index', [(1, 0), (55, 3), (65535, 255)])
+def test_answer_round_trip(question_number, answer_index):
+    data = encode_answer(question_number, answer_index)
+
+    assert len(data) == 7
+    assert decode_answer(data) == AnswerPayload(question_number=question_number, answer_index=answer_index)
+
+
+@pytest.mark.parametrize('data', [None, '', 'back', 'a', 'aAAAAAAA', 'b' + encode_answer(1, 0)[1:], 'a!!!!!!',
+                                  'aAgABAA',  # version 2
+                                  'aé12345', 'a١٢٣٤٥٦'])
+def test_garbage_is_not_an_answer(data):
+    assert decode_answer(data) is None
+
+
+def test_answer_filter():
+    assert answer_filter(make_callback_query(encode_answer(3, 1))) == {'answer': AnswerPayload(3, 1)}
+    assert answer_filter(make_callback_query('aé12345')) is False
+
+
+def test_throttling_passes_non_ascii_callback_data():
+    middleware = SilentThrottlingMiddleware(limit=1, burst=1, store=MemoryRateStore())
+    assert asyncio.run(count_allowed(middleware, [make_callback_query('aé12345')])) == 1
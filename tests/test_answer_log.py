@@ -0,0 +1,51 @@
+import asyncio
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import OperationalError
+
+import db.answer_log
+from db.answer_log import AnswerLogBuffer
+from db.db_engine import Results, SurveyAnswer
+
+
+def add_answers(buffer: AnswerLogBuffer, count: int, bad_question: int = None):
+    for question_number in range(1, count + 1):
+        points = None if question_number == bad_question else 1
+        buffer.add(1, 'low', question_number, 0, points)
+
+
+def count_answers(engine) -> int:
+    with engine.connect() as connection:
+        return connection.execute(select(func.count()).select_from(SurveyAnswer)).scalar()
+
+
+def test_rejected_answer_is_dropped_and_the_rest_written(engine):
+    with engine.begin() as connection:
+        connection.execute(insert(Results), {'user_id': 1, 'age_category': 'low'})
+    buffer = AnswerLogBuffer(batch_size=100, enabled=True)
+    add_answers(buffer, 10, bad_question=4)
+
+    asyncio.run(buffer.flush())
+
+    assert count_answers(engine) == 9
+    assert buffer.stats() == {'pending': 0, 'written': 9, 'dropped': 1, 'failed_flushes': 0}
+
+
+def test_failed_batch_is_kept_for_the_next_flush(engine, monkeypatch):
+    with engine.begin() as connection:
+        connection.execute(insert(Results), {'user_id': 1, 'age_category': 'low'})
+    buffer = AnswerLogBuffer(batch_size=100, enabled=True)
+    add_answers(buffer, 10)
+
+    def unavailable(rows):
+        raise OperationalError('INSERT', {}, Exception('server closed the connection'))
+
+    insert_answers = db.answer_log.insert_answers
+    monkeypatch.setattr(db.answer_log, 'insert_answers', unavailable)
+    asyncio.run(buffer.flush())
+    assert buffer.stats() == {'pending': 10, 'written': 0, 'dropped': 0, 'failed_flushes': 1}
+
+    monkeypatch.setattr(db.answer_log, 'insert_answers', insert_answers)
+    asyncio.run(buffer.flush())
+    assert count_answers(engine) == 10
+    assert buffer.pending() == 0
@@ -0,0 +1,103 @@
+import asyncio
+from datetime import datetime, timezone
+
+from aiogram import types
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher import FSMContext
+from sqlalchemy import insert
+
+from bot_app import common
+from bot_app.common import SAVE_FAILED_TEXT, cmd_start, rebuild_survey_data, survey_question
+from bot_app.keyboard.answer_codec import AnswerPayload
+from bot_app.question_bank import get_question_bank
+from bot_app.scoring import AGE_CATEGORY_LOW, FACTORS, score_answers
+from bot_main import RegistrationStates
+from db.db_engine import Results, SurveyAnswer, session_scope
+
+
+def make_message(user_id: int, text: str = '/start') -> types.Message:
+    return types.Message(**{'message_id': 1, 'date': 0, 'chat': {'id': user_id, 'type': 'private'},
+                            'from': {'id': user_id, 'is_bot': False, 'first_name': 'test'}, 'text': text})
+
+
+def make_state(user_id: int) -> FSMContext:
+    return FSMContext(MemoryStorage(), chat=user_id, user=user_id)
+
+
+def seed_survey(engine, user_id: int, answered: int, **results):
+    bank = get_question_bank('low')
+    answers = [{'user_id': user_id, 'bank': 'low', 'question_number': number, 'answer_index': 0,
+                'points': bank.get(number).answers[0].points, 'answered_at': datetime.now(timezone.utc)}
+               for number in range(1, answered + 1)]
+    with engine.begin() as connection:
+        connection.execute(insert(Results), {'user_id': user_id, 'age_category': AGE_CATEGORY_LOW, **results})
+        if answers:
+            connection.execute(insert(SurveyAnswer), answers)
+    return [(answer['question_number'], answer['points']) for answer in answers]
+
+
+def test_rebuild_survey_data_stops_at_the_first_gap():
+    data = rebuild_survey_data('low', [(1, 2), (2, 1), (1, 3), (4, 5)])
+
+    assert data['current_question'] == 4
+    assert data['logged_question'] == 2
+    assert data['scores'] == {**dict.fromkeys(FACTORS, 0), 'family_factor': 4}
+
+
+def test_start_rebuilds_a_lost_survey_from_the_answer_log(engine, bot_api):
+    answers = seed_survey(engine, 101, answered=3)
+    state = make_state(101)
+
+    asyncio.run(cmd_start(make_message(101), state))
+
+    data = asyncio.run(state.get_data())
+    assert asyncio.run(state.get_state()) == RegistrationStates.survey_question.state
+    assert data['current_question'] == 5
+    assert data['scores'] == {factor: value for factor, value in score_answers('low', answers).items()
+                              if factor in FACTORS}
+    assert [message['text'] for message in bot_api.sent('sendMessage')] == [get_question_bank('low').get(4).text]
+
+
+def test_start_saves_a_fully_answered_survey(engine, bot_api):
+    answers = seed_survey(engine, 102, answered=len(get_question_bank('low')))
+    state = make_state(102)
+
+    asyncio.run(cmd_start(make_message(102), state))
+
+    with session_scope() as session:
+        user = session.get(Results, 102)
+        assert user.total_risk == score_answers('low', answers)['total_risk']
+        assert user.total_risk_result is not None
+    assert asyncio.run(state.get_state()) is None
+    assert bot_api.sent('sendMessage')[0]['text'].startswith('Спасибо, опрос завершен!')
+
+
+def test_start_rejects_a_finished_survey(engine, bot_api):
+    seed_survey(engine, 103, answered=0, total_risk=10, total_risk_result='Низкая')
+
+    asyncio.run(cmd_start(make_message(103), make_state(103)))
+
+    assert bot_api.sent('sendMessage')[0]['text'] == 'Извините, Вы уже прошли тестирование'
+
+
+def test_failed_final_save_keeps_the_question(engine, bot_api, monkeypatch):
+    seed_survey(engine, 104, answered=0)
+    last = len(get_question_bank('low'))
+    state = make_state(104)
+    asyncio.run(state.set_state(RegistrationStates.survey_question))
+    asyncio.run(state.update_data(age_category='low', scores=dict.fromkeys(FACTORS, 0), current_question=last + 1))
+
+    async def save_failed(self, scores):
+        return False
+
+    monkeypatch.setattr(common.AsyncUser, 'save_results', save_failed)
+    callback_query = types.CallbackQuery(**{
+        'id': '1', 'from': {'id': 104, 'is_bot': False, 'first_name': 'test'}, 'chat_instance': '1', 'data': 'x',
+        'message': {'message_id': 7, 'date': 0, 'chat': {'id': 104, 'type': 'private'}, 'text': 'question'},
+    })
+    asyncio.run(survey_question(callback_query, state, AnswerPayload(question_number=last, answer_index=0)))
+
+    assert bot_api.sent('deleteMessage') == []
+    assert bot_api.sent('answerCallbackQuery')[0]['text'] == SAVE_FAILED_TEXT
+    assert asyncio.run(state.get_state()) == RegistrationStates.survey_question.state
+    assert asyncio.run(state.get_data())['logged_question'] == last
@@ -0,0 +1,39 @@
+import asyncio
+
+from sqlalchemy import text
+
+import middlewares.database
+from db.db_engine import current_unit_of_work, session_scope
+from middlewares.database import DatabaseMiddleware
+
+
+def run_update(monkeypatch, use_database: bool) -> list:
+    closed = []
+
+    async def run_sync(func, *args, **kwargs):
+        closed.append(func)
+        return func(*args, **kwargs)
+
+    monkeypatch.setattr(middlewares.database, 'run_sync', run_sync)
+
+    async def update():
+        data = {}
+        DatabaseMiddleware._open(data)
+        if use_database:
+            with session_scope() as session:
+                session.execute(text('SELECT 1'))
+        unit_of_work = current_unit_of_work.get()
+        await DatabaseMiddleware._close(data)
+        assert current_unit_of_work.get() is None
+        assert not unit_of_work.opened
+
+    asyncio.run(update())
+    return closed
+
+
+def test_unused_unit_of_work_is_not_closed_in_the_pool(monkeypatch):
+    assert run_update(monkeypatch, use_database=False) == []
+
+
+def test_used_unit_of_work_is_closed(migrated_engine, monkeypatch):
+    assert len(run_update(monkeypatch, use_database=True)) == 1
@@ -0,0 +1,110 @@
+import codecs
+import csv
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from openpyxl import load_workbook
+from sqlalchemy import insert
+
+import main
+from bot_app.scoring import AGE_CATEGORY_HIGH, AGE_CATEGORY_LOW
+from db.db_engine import Results
+from db.export import EXPORT_COLUMNS, export_results, iter_export
+
+AUTHORIZATION = {'Authorization': 'Bearer test-export-token'}
+
+
+def seed_results(engine):
+    rows = [
+        {'user_id': 1, 'first_name': 'Иван', 'last_name': 'Петров', 'student_class': '9А',
+         'age_category': AGE_CATEGORY_LOW, 'total_risk': 50, 'total_risk_result': 'Низкая'},
+        {'user_id': 2, 'first_name': '=HYPERLINK("http://example.com")', 'last_name': 'Иванов',
+         'student_class': '9А', 'age_category': AGE_CATEGORY_LOW, 'total_risk': 100, 'total_risk_result': 'Средняя'},
+        {'user_id': 3, 'first_name': 'Анна', 'last_name': 'Сидорова', 'student_class': '10Б',
+         'age_category': AGE_CATEGORY_HIGH, 'total_risk': 130, 'total_risk_result': 'Высокая'},
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(Results), rows)
+
+
+def read_csv(content: bytes) -> list:
+    assert content.startswith(codecs.BOM_UTF8)
+    return list(csv.reader(io.StringIO(content[len(codecs.BOM_UTF8):].decode('utf-8'))))
+
+
+@pytest.fixture
+def client(engine):
+    return TestClient(main.app)
+
+
+def test_csv_export_is_filtered_and_escaped(engine):
+    seed_results(engine)
+
+    rows = read_csv(b''.join(iter_export('csv', student_class='9А', age_category='low')))
+
+    assert rows[0] == list(EXPORT_COLUMNS)
+    names = [dict(zip(rows[0], row))['first_name'] for row in rows[1:]]
+    # Ordered by last name, a formula is written as text
+    assert names == ['\'=HYPERLINK("http://example.com")', 'Иван']
+
+
+def test_csv_export_is_streamed_in_chunks(engine):
+    with engine.begin() as connection:
+        connection.execute(insert(Results), [{'user_id': user_id, 'student_class': '9А'} for user_id in range(1, 2501)])
+
+    chunks = list(iter_export('csv'))
+
+    # BOM, then a chunk per 1000 rows
+    assert len(chunks) == 4
+    assert len(read_csv(b''.join(chunks))) == 2501
+
+
+def test_xlsx_workbook_contents(engine):
+    seed_results(engine)
+    file = io.BytesIO()
+
+    export_results(file, 'xlsx', age_category='16-18')
+
+    sheet = load_workbook(file)['results']
+    rows = [list(row) for row in sheet.iter_rows(values_only=True)]
+    assert rows[0] == list(EXPORT_COLUMNS)
+    assert len(rows) == 2
+    row = dict(zip(rows[0], rows[1]))
+    assert row['first_name'] == 'Анна'
+    assert row['total_risk'] == 130
+    assert row['total_risk_result'] == 'Высокая'
+
+
+@pytest.mark.parametrize('headers', [{}, {'Authorization': 'Bearer wrong'}, {'Authorization': 'test-export-token'}])
+def test_export_endpoint_requires_the_token(client, headers):
+    assert client.get('/export/results', headers=headers).status_code == 401
+
+
+def test_export_endpoint_streams_csv(client, engine):
+    seed_results(engine)
+
+    response = client.get('/export/results', params={'student_class': '10Б'}, headers=AUTHORIZATION)
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/csv')
+    assert response.headers['content-disposition'] == 'attachment; filename="results.csv"'
+    # A streamed response has no length known in advance
+    assert 'content-length' not in response.headers
+    rows = read_csv(response.content)
+    assert [dict(zip(rows[0], row))['last_name'] for row in rows[1:]] == ['Сидорова']
+
+
+def test_export_endpoint_sends_xlsx(client, engine):
+    seed_results(engine)
+
+    response = client.get('/export/results', params={'format': 'xlsx'}, headers=AUTHORIZATION)
+
+    assert response.status_code == 200
+    assert response.headers['content-disposition'] == 'attachment; filename="results.xlsx"'
+    assert load_workbook(io.BytesIO(response.content))['results'].max_row == 4
+
+
+@pytest.mark.parametrize('params', [{'format': 'pdf'}, {'age_category': 'old'}])
+def test_export_endpoint_rejects_invalid_filters(client, params):
+    assert client.get('/export/results', params=params, headers=AUTHORIZATION).status_code == 400
@@ -0,0 +1,124 @@
+import asyncio
+import json
+
+import pytest
+
+from storage.fsm_storage import CompactRedisStorage, TracedMemoryStorage, create_storage
+
+fake_aioredis = pytest.importorskip('fakeredis.aioredis')
+
+CHAT_ID = 42
+USER_ID = 42
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def create_fake_storage(**kwargs) -> CompactRedisStorage:
+    storage = CompactRedisStorage(prefix='test', **kwargs)
+    storage._redis = fake_aioredis.FakeRedis(decode_responses=True)
+    return storage
+
+
+def test_data_round_trip_is_compact_json():
+    async def check():
+        storage = create_fake_storage()
+        data = {'age_category': 'low', 'answers': [1, 2, 3], 'name': 'Иван'}
+        await storage.set_state(chat=CHAT_ID, user=USER_ID, state='RegistrationStates:survey_question')
+        await storage.set_data(chat=CHAT_ID, user=USER_ID, data=data)
+
+        raw = await storage._redis.get(storage.generate_key(CHAT_ID, USER_ID, 'data'))
+        assert raw == '{"age_category":"low","answers":[1,2,3],"name":"Иван"}'
+        assert json.loads(raw) == data
+        assert await storage.get_data(chat=CHAT_ID, user=USER_ID) == data
+        assert await storage.get_state(chat=CHAT_ID, user=USER_ID) == 'RegistrationStates:survey_question'
+
+        await storage.update_data(chat=CHAT_ID, user=USER_ID, question_number=2)
+        assert (await storage.get_data(chat=CHAT_ID, user=USER_ID))['question_number'] == 2
+
+    run(check())
+
+
+def test_empty_data_and_bucket_delete_the_keys():
+    async def check():
+        storage = create_fake_storage()
+        await storage.set_data(chat=CHAT_ID, user=USER_ID, data={'a': 1})
+        await storage.set_bucket(chat=CHAT_ID, user=USER_ID, bucket={'b': 2})
+        assert await storage.get_bucket(chat=CHAT_ID, user=USER_ID) == {'b': 2}
+
+        await storage.set_data(chat=CHAT_ID, user=USER_ID, data={})
+        await storage.set_bucket(chat=CHAT_ID, user=USER_ID, bucket={})
+        assert await storage._redis.keys('test:*') == []
+        assert await storage.get_data(chat=CHAT_ID, user=USER_ID) == {}
+
+    run(check())
+
+
+def test_keys_expire_after_the_ttl():
+    async def check():
+        storage = create_fake_storage(state_ttl=60, data_ttl=120, bucket_ttl=1)
+        await storage.set_state(chat=CHAT_ID, user=USER_ID, state='state')
+        await storage.set_data(chat=CHAT_ID, user=USER_ID, data={'a': 1})
+        await storage.set_bucket(chat=CHAT_ID, user=USER_ID, bucket={'b': 2})
+
+        assert 0 < await storage._redis.ttl(storage.generate_key(CHAT_ID, USER_ID, 'state')) <= 60
+        assert 60 < await storage._redis.ttl(storage.generate_key(CHAT_ID, USER_ID, 'data')) <= 120
+
+        await asyncio.sleep(1.1)
+        assert await storage.get_bucket(chat=CHAT_ID, user=USER_ID) == {}
+        assert await storage.get_data(chat=CHAT_ID, user=USER_ID) == {'a': 1}
+
+    run(check())
+
+
+def test_no_ttl_by_default():
+    async def check():
+        storage = create_fake_storage()
+        await storage.set_data(chat=CHAT_ID, user=USER_ID, data={'a': 1})
+        assert await storage._redis.ttl(storage.generate_key(CHAT_ID, USER_ID, 'data')) == -1
+
+    run(check())
+
+
+def test_create_storage_memory_by_default(monkeypatch):
+    monkeypatch.delenv('FSM_STORAGE', raising=False)
+    assert isinstance(create_storage(), TracedMemoryStorage)
+
+
+def test_create_storage_redis_from_environment(monkeypatch):
+    monkeypatch.setenv('FSM_STORAGE', 'redis')
+    monkeypatch.setenv('REDIS_PREFIX', 'bot')
+    monkeypatch.setenv('FSM_DATA_TTL', '3600')
+    monkeypatch.delenv('FSM_STATE_TTL', raising=False)
+
+    storage = create_storage()
+    assert isinstance(storage, CompactRedisStorage)
+    assert storage.generate_key(CHAT_ID, USER_ID, 'data') == f'bot:{CHAT_ID}:{USER_ID}:data'
+    assert storage._data_ttl == 3600
+    assert storage._state_ttl is None
+
+
+def test_create_storage_argument_overrides_environment(monkeypatch):
+    monkeypatch.setenv('FSM_STORAGE', 'redis')
+    assert isinstance(create_storage('memory'), TracedMemoryStorage)
+
+
+def test_create_storage_unknown_type():
+    with pytest.raises(ValueError):
+        create_storage('mongo')
+
+
+@pytest.mark.parametrize('storage_factory', [create_fake_storage, TracedMemoryStorage], ids=['redis', 'memory'])
+def test_chats_with_state_are_counted(storage_factory):
+    async def check():
+        storage = storage_factory()
+        for chat_id in range(1, 4):
+            await storage.set_state(chat=chat_id, user=chat_id, state='RegistrationStates:survey_question')
+        await storage.set_data(chat=10, user=10, data={'age_category': 'low'})
+        assert await storage.count_chats() == 3
+
+        await storage.set_state(chat=1, user=1, state=None)
+        assert await storage.count_chats() == 2
+
+    run(check())
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import re
+import threading
+from collections import defaultdict
+
+import pytest
+from aiogram import Bot, Dispatcher, types
+from aiogram.contrib.middlewares.logging import LoggingMiddleware
+
+import logs.logger
+from logs.logger import UPDATE_LOGGER_NAME, SamplingFilter, _create_queue_handler, _listeners
+from middlewares.log_sampling import LogSamplingMiddleware
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.threads = set()
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(self.format(record))
+        self.threads.add(threading.current_thread().name)
+
+
+def make_update(update_id: int) -> types.Update:
+    return types.Update(**{
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': update_id, 'type': 'private'},
+            'from': {'id': update_id, 'is_bot': False, 'first_name': 'test'},
+            'text': 'text',
+        },
+    })
+
+
+@pytest.mark.parametrize('through_update_handlers', [False, True], ids=['webhook', 'polling'])
+def test_update_logs_are_sampled_per_update(monkeypatch, through_update_handlers):
+    monkeypatch.setattr(logs.logger, 'LOG_UPDATE_SAMPLE_RATE', 0.5)
+    handler = ListHandler()
+    handler.addFilter(SamplingFilter())
+    update_logger = logging.getLogger(UPDATE_LOGGER_NAME)
+    update_logger.addHandler(handler)
+    level = update_logger.level
+    update_logger.setLevel(logging.DEBUG)
+
+    async def handle(message: types.Message):
+        pass
+
+    async def check():
+        dp = Dispatcher(Bot(token='123456789:test'))
+        dp.middleware.setup(LogSamplingMiddleware())
+        dp.middleware.setup(LoggingMiddleware())
+        dp.register_message_handler(handle)
+        # The webhook calls process_update, polling goes through the update handlers
+        process = dp.updates_handler.notify if through_update_handlers else dp.process_update
+        # One update after another in the same task, like a lane
+        for n in range(1, 101):
+            await process(make_update(n))
+
+    try:
+        asyncio.run(check())
+    finally:
+        update_logger.removeHandler(handler)
+        update_logger.setLevel(level)
+
+    logged = defaultdict(set)
+    for record in handler.records:
+        line = re.match(r'(\w+ \w+) \[ID:(\d+)]', record)
+        logged[line.group(1)].add(int(line.group(2)))
+
+    assert 0 < len(logged['Received message']) < 100
+    # A sampled update is logged completely
+    assert logged['Unhandled message'] == logged['Received message']
+    if through_update_handlers:
+        assert logged['Received update'] == logged['Received message']
+
+
+def test_records_are_formatted_by_the_listener_thread():
+    handler = ListHandler()
+    queue_handler = _create_queue_handler(handler)
+    listener = _listeners.pop()
+    logger = logging.getLogger('test_listener')
+    logger.addHandler(queue_handler)
+    try:
+        logger.warning('value %s', 42)
+    finally:
+        logger.removeHandler(queue_handler)
+        listener.stop()
+
+    assert handler.records == ['value 42']
+    assert threading.current_thread().name not in handler.threads
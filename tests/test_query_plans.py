@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import Select, select, text
+from sqlalchemy.engine import Connection
+
+from db.db_engine import BugReport, SurveyAnswer
+from db.export import results_query
+
+# (query, index which must be in the plan)
+CHECKS = {
+    'bug report of a user': (select(BugReport).where(BugReport.user_id == 1).limit(1), 'ix_bug_reports_user_id'),
+    'bug reports by status': (select(BugReport).where(BugReport.report_status == 'Open'),
+                              'ix_bug_reports_report_status'),
+    'export of a class and age category': (results_query('9А', 'low'), 'ix_results_student_class_age_category'),
+    'export of a class': (results_query('9А'), 'ix_results_student_class_age_category'),
+    'answers of a user': (select(SurveyAnswer).where(SurveyAnswer.user_id == 1), 'ix_answers_user_id'),
+}
+
+
+def explain(connection: Connection, query: Select) -> str:
+    sql = str(query.compile(connection, compile_kwargs={'literal_binds': True}))
+    if connection.dialect.name == 'sqlite':
+        rows = connection.execute(text(f'EXPLAIN QUERY PLAN {sql}'))
+        return '\n'.join(row[-1] for row in rows)
+    return '\n'.join(row[0] for row in connection.execute(text(f'EXPLAIN {sql}')))
+
+
+@pytest.mark.parametrize('query, index', CHECKS.values(), ids=CHECKS.keys())
+def test_query_uses_index(migrated_engine, query, index):
+    with migrated_engine.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            # The test database is empty, a sequential scan would always win
+            connection.execute(text('SET enable_seqscan = off'))
+        plan = explain(connection, query)
+
+    assert index in plan, plan
@@ -0,0 +1,82 @@
+import json
+import os
+
+from bot_app.question_bank import QuestionBank
+
+
+def write_bank(path, *texts: str, mtime: float = None):
+    questions = [{'number': number, 'text': text, 'answers': [{'text': 'Да', 'points': 1}, {'text': 'Нет', 'points': 0}]}
+                 for number, text in enumerate(texts, start=1)]
+    path.write_text(json.dumps({'questions': questions}, ensure_ascii=False), encoding='utf-8')
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_bank_is_indexed_by_question_number(tmp_path):
+    path = tmp_path / 'questions.json'
+    write_bank(path, 'first', 'second')
+    bank = QuestionBank(str(path))
+
+    assert len(bank) == 2
+    assert bank.get(2).text == 'second'
+    assert bank.get(2).answers[0].points == 1
+    assert bank.get(0) is None
+    assert bank.get(3) is None
+    assert bank.get(None) is None
+
+
+def test_changed_file_is_reloaded(tmp_path):
+    path = tmp_path / 'questions.json'
+    write_bank(path, 'first', mtime=1000)
+    bank = QuestionBank(str(path), check_interval=0)
+
+    assert not bank.reload_if_changed()
+
+    write_bank(path, 'edited', 'added', mtime=2000)
+    assert bank.reload_if_changed()
+    assert bank.get(1).text == 'edited'
+    assert len(bank) == 2
+
+
+def test_file_is_checked_once_per_interval(tmp_path):
+    path = tmp_path / 'questions.json'
+    write_bank(path, 'first', mtime=1000)
+    bank = QuestionBank(str(path), check_interval=3600)
+
+    write_bank(path, 'edited', mtime=2000)
+    assert not bank.reload_if_changed()
+    assert bank.get(1).text == 'first'
+
+
+def test_invalid_file_keeps_the_previous_bank(tmp_path):
+    path = tmp_path / 'questions.json'
+    write_bank(path, 'first', mtime=1000)
+    bank = QuestionBank(str(path), check_interval=0)
+
+    # Half-written file
+    path.write_text('{"questions": [{"number": 1, "text": "ed', encoding='utf-8')
+    os.utime(path, (2000, 2000))
+    assert not bank.reload_if_changed()
+    assert bank.get(1).text == 'first'
+
+    # Valid JSON with an invalid question
+    path.write_text(json.dumps({'questions': [{'number': 1, 'text': 'edited', 'answers': [{'points': 'x'}]}]}),
+                    encoding='utf-8')
+    os.utime(path, (3000, 3000))
+    assert not bank.reload_if_changed()
+    assert bank.get(1).text == 'first'
+
+    # The fixed file is loaded on the next check
+    write_bank(path, 'fixed', mtime=4000)
+    assert bank.reload_if_changed()
+    assert bank.get(1).text == 'fixed'
+
+
+def test_removed_file_keeps_the_previous_bank(tmp_path):
+    path = tmp_path / 'questions.json'
+    write_bank(path, 'first', mtime=1000)
+    bank = QuestionBank(str(path), check_interval=0)
+
+    path.unlink()
+    assert not bank.reload_if_changed()
+    assert bank.get(1).text == 'first'
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+from aiogram import types
+
+from dispatching.rate_limiter import PRIORITY_BACKGROUND, OutboundScheduler
+from dispatching.update_queue import ShardedUpdateQueue
+
+
+def make_update(update_id: int, chat_id: int) -> types.Update:
+    return types.Update(**{
+        'update_id': update_id,
+        'message': {'message_id': update_id, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}, 'text': 'text'},
+    })
+
+
+def test_chat_burst_is_paced():
+    scheduler = OutboundScheduler(global_rate=1000, chat_rate=10, chat_burst=2)
+
+    async def send(count: int) -> float:
+        started = time.monotonic()
+        for _ in range(count):
+            await scheduler.acquire(1)
+        return time.monotonic() - started
+
+    assert asyncio.run(send(2)) < 0.05
+    # The burst is used up, the next calls wait for the refill
+    assert asyncio.run(send(2)) >= 0.15
+    assert scheduler.stats()['sent'] == 4
+    assert scheduler.stats()['delayed'] == 2
+
+
+def test_chats_have_separate_limits():
+    scheduler = OutboundScheduler(global_rate=1000, chat_rate=1, chat_burst=1)
+
+    async def send():
+        started = time.monotonic()
+        await asyncio.gather(*(scheduler.acquire(chat_id) for chat_id in range(10)))
+        return time.monotonic() - started
+
+    assert asyncio.run(send()) < 0.05
+    assert scheduler.stats()['chats'] == 10
+
+
+def test_background_calls_wait_for_interactive_calls():
+    scheduler = OutboundScheduler(global_rate=10, chat_rate=1000, chat_burst=1000)
+    order = []
+
+    async def send(chat_id: int, priority: int):
+        await scheduler.acquire(chat_id, priority)
+        order.append(priority)
+
+    async def check():
+        # The global burst is used up
+        for chat_id in range(10):
+            await scheduler.acquire(chat_id)
+        interactive = [asyncio.create_task(send(chat_id, 0)) for chat_id in range(3)]
+        await asyncio.sleep(0)
+        await asyncio.gather(send(100, PRIORITY_BACKGROUND), *interactive)
+
+    asyncio.run(check())
+    assert order == [0, 0, 0, PRIORITY_BACKGROUND]
+
+
+def test_chat_waiting_for_its_limit_does_not_hold_up_the_lane():
+    scheduler = OutboundScheduler(global_rate=1000, chat_rate=5, chat_burst=1)
+    processed = []
+
+    async def process(update: types.Update):
+        chat_id = update.message.chat.id
+        await scheduler.acquire(chat_id)
+        processed.append((chat_id, update.update_id, time.monotonic()))
+
+    async def check():
+        queue = ShardedUpdateQueue(process=process, lanes=1, maxsize=100)
+        queue.start()
+        started = time.monotonic()
+        # A fast tapper in chat 1, then single updates of other chats on the same lane
+        for update_id in range(1, 5):
+            queue.put_nowait(make_update(update_id, chat_id=1))
+        for chat_id in range(2, 6):
+            queue.put_nowait(make_update(10 + chat_id, chat_id=chat_id))
+        await queue.stop()
+        return started, queue.stats()
+
+    started, stats = asyncio.run(check())
+
+    assert stats['processed'] == 8
+    assert stats['depth'] == 0
+    assert stats['released'] >= 1
+    # Updates of the chat stay in order
+    assert [update_id for chat_id, update_id, _ in processed if chat_id == 1] == [1, 2, 3, 4]
+    # The other chats are not delayed by the 0.6 s chat 1 waits for its limit
+    assert all(finished - started < 0.1 for chat_id, _, finished in processed if chat_id != 1)
@@ -0,0 +1,73 @@
+import random
+from collections import Counter
+
+from sqlalchemy import event, insert, select
+
+from bot_app.scoring import AGE_CATEGORY_HIGH, AGE_CATEGORY_LOW, score_batch
+from db.db_engine import RESULT_BAND_FIELDS, Results, get_result_stats
+from db.rescore import RESULT_COLUMNS, rescore
+
+
+def make_rows(count: int) -> list:
+    rng = random.Random(0)
+    rows = []
+    for user_id in range(1, count + 1):
+        row = {
+            'user_id': user_id,
+            'student_class': rng.choice(('9А', '10Б', '11В')),
+            'age_category': rng.choice((AGE_CATEGORY_LOW, AGE_CATEGORY_HIGH)),
+            'family_factor': rng.randint(0, 30),
+            'psychological_factor': rng.randint(0, 30),
+            'env_factor': rng.randint(0, 30),
+            'school_factor': rng.randint(0, 30),
+            'total_risk': 0,
+        }
+        # Bands calculated with old thresholds
+        row.update({field: 'stale' for field in RESULT_BAND_FIELDS})
+        rows.append(row)
+    return rows
+
+
+def test_rescore_updates_finished_results_chunk_by_chunk(engine):
+    rows = make_rows(10)
+    unfinished = {'user_id': 100, 'age_category': AGE_CATEGORY_LOW, 'family_factor': 5, 'psychological_factor': 5,
+                  'env_factor': 5, 'school_factor': 5, 'total_risk': 0}
+    with engine.begin() as connection:
+        connection.execute(insert(Results), rows)
+        connection.execute(insert(Results), unfinished)
+
+    updates = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE results'):
+            updates.append(len(parameters) if executemany else 1)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        assert rescore(chunk_size=4) == 10
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    # One executemany statement per chunk
+    assert updates == [4, 4, 2]
+
+    expected = score_batch([
+        (row['age_category'], row['family_factor'], row['psychological_factor'], row['env_factor'],
+         row['school_factor'])
+        for row in rows
+    ])
+    columns = [getattr(Results, column) for column in RESULT_COLUMNS]
+    with engine.connect() as connection:
+        stored = connection.execute(select(*columns).where(Results.user_id <= 10).order_by(Results.user_id)).all()
+        assert [tuple(row) for row in stored] == expected
+        assert connection.execute(
+            select(Results.total_risk_result).where(Results.user_id == 100)
+        ).scalar_one() is None
+
+    # result_stats is recounted from the new bands
+    expected_stats = Counter()
+    for row, values in zip(rows, expected):
+        for field, band in zip(RESULT_BAND_FIELDS, values[1:]):
+            expected_stats[row['student_class'], row['age_category'], field, band] += 1
+    stats = {(row[0], row[1], row[2], row[3]): row[4] for row in get_result_stats()}
+    assert stats == dict(expected_stats)
@@ -0,0 +1,107 @@
+import pytest
+
+from bot_app.question_bank import get_question_bank
+from bot_app.scoring import (
+    AGE_CATEGORY_HIGH, AGE_CATEGORY_LOW, FACTORS, RESULT_FIELDS, get_question_factor, score, score_answers,
+    score_batch
+)
+
+# Scoring of the bot before the tables were compiled, copied from its handlers and User.set_results
+LEGACY_QUESTION_FACTORS = {
+    AGE_CATEGORY_LOW: {
+        (1, 13): 'family_factor',
+        (14, 30): 'psychological_factor',
+        (31, 46): 'env_factor',
+        (47, 53): 'school_factor',
+    },
+    AGE_CATEGORY_HIGH: {
+        (1, 16): 'family_factor',
+        (17, 30): 'psychological_factor',
+        (31, 47): 'env_factor',
+        (48, 54): 'school_factor',
+    },
+}
+LEGACY_BANDS = {
+    AGE_CATEGORY_LOW: {
+        'family_factor': {(0, 15): 'Низкая', (16, 26): 'Средняя', (27, 100): 'Высокая'},
+        'psychological_factor': {(0, 20): 'Низкая', (21, 37): 'Средняя', (38, 100): 'Высокая'},
+        'env_factor': {(0, 24): 'Низкая', (25, 41): 'Средняя', (42, 100): 'Высокая'},
+        'school_factor': {(0, 9): 'Низкая', (10, 14): 'Средняя', (15, 100): 'Высокая'},
+        'total_risk': {(0, 68): 'Низкая', (69, 118): 'Средняя', (119, 200): 'Высокая'},
+    },
+    AGE_CATEGORY_HIGH: {
+        'family_factor': {(0, 17): 'Низкая', (18, 33): 'Средняя', (34, 100): 'Высокая'},
+        'psychological_factor': {(0, 16): 'Низкая', (17, 37): 'Средняя', (38, 100): 'Высокая'},
+        'env_factor': {(0, 22): 'Низкая', (23, 42): 'Средняя', (43, 100): 'Высокая'},
+        'school_factor': {(0, 10): 'Низкая', (11, 16): 'Средняя', (17, 100): 'Высокая'},
+        'total_risk': {(0, 65): 'Низкая', (66, 128): 'Средняя', (129, 200): 'Высокая'},
+    },
+}
+BANKS = {AGE_CATEGORY_LOW: 'low', AGE_CATEGORY_HIGH: 'high'}
+
+
+def legacy_question_factors(age_category: str, count: int) -> dict:
+    # The factor was kept in the state and changed only by a question inside a range
+    factors = {}
+    factor = None
+    for number in range(1, count + 1):
+        for (low, high), range_factor in LEGACY_QUESTION_FACTORS[age_category].items():
+            if low <= number <= high:
+                factor = range_factor
+                break
+        factors[number] = factor
+    return factors
+
+
+def legacy_band(age_category: str, field: str, value: int) -> str:
+    for (low, high), band in LEGACY_BANDS[age_category][field].items():
+        if low <= value <= high:
+            return band
+
+
+@pytest.mark.parametrize('age_category', [AGE_CATEGORY_LOW, AGE_CATEGORY_HIGH])
+def test_question_factors_match_the_legacy_ranges(age_category):
+    question_bank = get_question_bank(BANKS[age_category])
+    expected = legacy_question_factors(age_category, len(question_bank))
+
+    assert {number: get_question_factor(age_category, number) for number in expected} == expected
+
+
+def test_last_high_question_is_a_school_factor_question():
+    assert len(get_question_bank('high')) == 55
+    assert get_question_factor(AGE_CATEGORY_HIGH, 55) == 'school_factor'
+    assert get_question_factor('high', 55) == 'school_factor'
+
+
+@pytest.mark.parametrize('age_category', [AGE_CATEGORY_LOW, AGE_CATEGORY_HIGH])
+@pytest.mark.parametrize('field', RESULT_FIELDS)
+def test_bands_match_the_legacy_thresholds(age_category, field):
+    limit = 200 if field == 'total_risk' else 100
+    for value in range(limit + 1):
+        if field == 'total_risk':
+            scores = dict.fromkeys(FACTORS, 0)
+            scores['family_factor'] = value
+        else:
+            scores = {field: value}
+        assert score(age_category, scores)[field + '_result'] == legacy_band(age_category, field, value), value
+
+
+@pytest.mark.parametrize('age_category', [AGE_CATEGORY_LOW, AGE_CATEGORY_HIGH])
+def test_score_answers_matches_the_legacy_totals(age_category):
+    question_bank = get_question_bank(BANKS[age_category])
+    factors = legacy_question_factors(age_category, len(question_bank))
+    answers = [(number, question_bank.get(number).answers[number % len(question_bank.get(number).answers)].points)
+               for number in range(1, len(question_bank) + 1)]
+
+    totals = dict.fromkeys(FACTORS, 0)
+    for number, points in answers:
+        totals[factors[number]] += points
+    results = score_answers(age_category, answers)
+
+    assert {factor: results[factor] for factor in FACTORS} == totals
+    assert results['total_risk'] == sum(totals.values())
+    for field in RESULT_FIELDS:
+        assert results[field + '_result'] == legacy_band(age_category, field, results[field])
+    assert score_batch([(age_category, *(totals[factor] for factor in FACTORS))])[0] == (
+        (results['total_risk'],) + tuple(results[field + '_result'] for field in RESULT_FIELDS)
+    )
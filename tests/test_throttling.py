@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler
+
+from bot_app.keyboard.answer_codec import encode_answer
+from middlewares.throttling import MemoryRateStore, ThrottlingMiddleware
+from monitoring.metrics import UPDATES_THROTTLED
+
+USER = {'id': 5, 'is_bot': False, 'first_name': 'test'}
+
+
+class SilentThrottlingMiddleware(ThrottlingMiddleware):
+    async def target_throttled(self, target, retry_after: float):
+        pass
+
+
+def make_callback_query(data: str) -> types.CallbackQuery:
+    return types.CallbackQuery(**{'id': '1', 'from': USER, 'chat_instance': '1', 'data': data})
+
+
+def make_message() -> types.Message:
+    return types.Message(**{'message_id': 1, 'date': 0, 'chat': {'id': USER['id'], 'type': 'private'},
+                            'from': USER, 'text': 'text'})
+
+
+async def count_allowed(middleware: ThrottlingMiddleware, targets) -> int:
+    allowed = 0
+    for target in targets:
+        try:
+            await middleware.throttle(target)
+            allowed += 1
+        except CancelHandler:
+            pass
+    return allowed
+
+
+def test_answer_taps_have_their_own_higher_limit():
+    middleware = SilentThrottlingMiddleware(limit=1, burst=2, answer_limit=1, answer_burst=10, store=MemoryRateStore())
+
+    async def check():
+        answers = [make_callback_query(encode_answer(number, 0)) for number in range(1, 13)]
+        assert await count_allowed(middleware, answers) == 10
+        # Other buttons and messages are limited separately
+        assert await count_allowed(middleware, [make_callback_query('back')] * 3) == 2
+        assert await count_allowed(middleware, [make_message()] * 3) == 0
+
+    asyncio.run(check())
+
+
+def test_rejected_updates_are_counted():
+    middleware = SilentThrottlingMiddleware(limit=1, burst=1, store=MemoryRateStore())
+    before = UPDATES_THROTTLED.labels('message')._value.get()
+
+    async def check():
+        await middleware.throttle(make_message())
+        with pytest.raises(CancelHandler):
+            await middleware.throttle(make_message())
+
+    asyncio.run(check())
+    assert UPDATES_THROTTLED.labels('message')._value.get() == before + 1
+    assert middleware.rejected == 1
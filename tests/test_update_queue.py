@@ -0,0 +1,61 @@
+import asyncio
+from typing import List
+
+from aiogram import Bot, types
+
+from dispatching.update_queue import OrderedDispatcher
+
+CHAT_ID = 7
+
+
+def make_update(update_id: int) -> types.Update:
+    return types.Update(**{
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': CHAT_ID, 'type': 'private'},
+            'from': {'id': CHAT_ID, 'is_bot': False, 'first_name': 'test'},
+            'text': str(update_id),
+        },
+    })
+
+
+def test_polling_waits_for_full_lanes_and_keeps_order():
+    async def check():
+        bot = Bot(token='123456789:test')
+        dp = OrderedDispatcher(bot)
+        handled: List[int] = []
+        batches = iter(range(10))
+        polls = 0
+
+        async def get_updates(offset=None, **kwargs):
+            nonlocal polls
+            polls += 1
+            try:
+                batch = next(batches)
+            except StopIteration:
+                dp.stop_polling()
+                await asyncio.sleep(0)
+                return []
+            return [make_update(batch * 5 + number) for number in range(5)]
+
+        async def handler(message: types.Message):
+            await asyncio.sleep(0.01)
+            handled.append(message.message_id)
+
+        bot.get_updates = get_updates
+        dp.register_message_handler(handler)
+        dp.start_lanes(lanes=1, maxsize=2)
+
+        polling = asyncio.create_task(dp.start_polling(reset_webhook=False, relax=0))
+        await asyncio.sleep(0.05)
+        # A lane holds 2 updates, polling waits instead of piling up batches
+        assert polls <= 2
+        assert dp.update_queue.depth() <= 2
+
+        await polling
+        await dp.stop_lanes()
+        assert handled == list(range(50))
+
+    asyncio.run(check())